@@ -0,0 +1,82 @@
+import threading
+import time
+
+# AIMD (additive increase, multiplicative decrease) controller for the upload stage, the same scheme TCP uses
+# for its congestion window. It steers two knobs:
+# - batch_size: the number of points the reader puts in the next batch
+# - concurrency: the number of upserts that may be in flight at the same time
+#
+# Every upsert is reported back through release():
+# - an error (timeout, gRPC error, ...) or a window of upserts slower than target_latency on average
+#   multiplies both knobs by backoff
+# - a window of upserts within target_latency adds batch_step to the batch size and 1 to the concurrency
+# A window is as many upserts as the current concurrency, so every in-flight slot reports once per decision.
+# Only upserts started after the last decrease can trigger the next one, otherwise a burst of failures
+# from the same overload would collapse both knobs to their minimum.
+class AimdController:
+    def __init__(self, batch_size, concurrency, min_batch_size, max_batch_size, max_concurrency, target_latency, batch_step=None, backoff=0.5, log=print):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.batch_step = batch_step or max(1, batch_size // 10)
+        self.backoff = backoff
+        self.log = log
+        self.in_flight = 0
+        self.latencies = []
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    # A controller that keeps both knobs where they are, but still limits the in-flight upserts
+    @classmethod
+    def fixed(cls, batch_size, concurrency, target_latency=float("inf"), log=print):
+        return cls(batch_size, concurrency, batch_size, batch_size, concurrency, target_latency, backoff=1.0, log=log)
+
+    # Blocks until an upsert slot is free, returns the start time to pass to release()
+    def acquire(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, error=None):
+        with self.condition:
+            self.in_flight -= 1
+            if error is not None:
+                if started > self.last_decrease:
+                    self.decrease(f"{type(error).__name__}: {error}")
+            else:
+                self.latencies.append(time.monotonic() - started)
+                if len(self.latencies) >= self.concurrency:
+                    latency = sum(self.latencies) / len(self.latencies)
+                    self.latencies = []
+                    if latency > self.target_latency:
+                        if started > self.last_decrease:
+                            self.decrease(f"average latency {latency:.2f}s above target {self.target_latency:.2f}s")
+                    else:
+                        self.increase(f"average latency {latency:.2f}s within target {self.target_latency:.2f}s")
+            self.condition.notify_all()
+
+    def increase(self, reason):
+        self.update(
+            min(self.max_batch_size, self.batch_size + self.batch_step),
+            min(self.max_concurrency, self.concurrency + 1),
+            reason
+        )
+
+    def decrease(self, reason):
+        self.last_decrease = time.monotonic()
+        self.latencies = []
+        self.update(
+            max(self.min_batch_size, int(self.batch_size * self.backoff)),
+            max(1, int(self.concurrency * self.backoff)),
+            reason
+        )
+
+    def update(self, batch_size, concurrency, reason):
+        if (batch_size, concurrency) == (self.batch_size, self.concurrency):
+            return
+        self.log(f"AIMD: batch size {self.batch_size} -> {batch_size}, concurrency {self.concurrency} -> {concurrency} ({reason})")
+        self.batch_size, self.concurrency = batch_size, concurrency
@@ -0,0 +1,113 @@
+from qdrant_client import models, grpc
+from qdrant_client.conversions.conversion import RestToGrpc, json_to_value
+import numpy as np
+
+# Columnar upsert of points with a named dense and a named sparse vector:
+# - ids: list of point ids (int or uuid string)
+# - dense: 2D float matrix, one row per point
+# - sparse: CSR arrays (indptr, indices, values), row i spans indices[indptr[i]:indptr[i+1]]
+# - payload: dict of column name -> list of values, one value per point
+#
+# A models.Batch needs the named vectors as a dict of lists ({"dense": [...], "sparse": [...]}),
+# not as a list of dicts, that is why the attempt in attic/batch.py does not work.
+# For gRPC clients the Batch is skipped altogether: the vectors are written straight from the
+# numpy buffers into protobuf wire format, so no Python float or pydantic model is created per point.
+def upsert_columns(client, collection_name, ids, dense, sparse, payload, dense_name="dense", sparse_name="sparse", **kwargs):
+    points = columns_to_points(client, ids, dense, sparse, payload, dense_name, sparse_name)
+    return client.upsert(collection_name=collection_name, points=points, **kwargs)
+
+# The points argument for client.upsert, split off from upsert_columns so serialization can be timed on its own
+def columns_to_points(client, ids, dense, sparse, payload, dense_name="dense", sparse_name="sparse"):
+    dense = np.ascontiguousarray(dense, dtype="<f4")
+    indptr, indices, values = sparse
+    if uses_grpc(client):
+        return grpc_points(ids, dense, indptr, indices, values, payload, dense_name, sparse_name)
+    return models.Batch(
+        ids=list(ids),
+        vectors={
+            dense_name: dense.tolist(),
+            sparse_name: [
+                models.SparseVector(indices=indices[start:end].tolist(), values=values[start:end].tolist())
+                for start, end in zip(indptr[:-1], indptr[1:])
+            ]
+        },
+        payloads=payload_rows(payload, len(ids))
+    )
+
+# Only remote clients with prefer_grpc accept prebuilt protobuf points, local mode and REST take a models.Batch
+def uses_grpc(client):
+    options = client.init_options
+    return bool(options.get("prefer_grpc")) and options.get("location") != ":memory:" and options.get("path") is None
+
+# Select rows (an array of row indexes) from the columns of a batch, returns (ids, dense, sparse, payload)
+def select_rows(rows, ids, dense, sparse, payload):
+    indptr, indices, values = sparse
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    selected_indptr = np.concatenate(([0], np.cumsum(lengths)))
+    positions = np.arange(selected_indptr[-1]) + np.repeat(starts - selected_indptr[:-1], lengths)
+    return (
+        [ids[row] for row in rows],
+        dense[rows],
+        (selected_indptr, indices[positions], values[positions]),
+        {key: [column[row] for row in rows] for key, column in payload.items()}
+    )
+
+def payload_rows(payload, count):
+    return [{key: column[i] for key, column in payload.items()} for i in range(count)]
+
+def grpc_points(ids, dense, indptr, indices, values, payload, dense_name, sparse_name):
+    indptr = np.asarray(indptr, dtype=np.int64)
+    values = np.ascontiguousarray(values, dtype="<f4")
+    # Sparse indices are varints on the wire, encode them all at once and slice per point
+    index_bytes, index_lengths = encode_varints(indices)
+    index_offsets = np.concatenate(([0], np.cumsum(index_lengths)))[indptr]
+    dense_header = b"\x0a" + encode_varint(dense.shape[1] * 4)
+
+    points = []
+    for i, point_id in enumerate(ids):
+        start, end = indptr[i], indptr[i + 1]
+        sparse_indices = index_bytes[index_offsets[i]:index_offsets[i + 1]].tobytes()
+        sparse_values = values[start:end].tobytes()
+        points.append(
+            grpc.PointStruct(
+                id=RestToGrpc.convert_extended_point_id(point_id),
+                vectors=grpc.Vectors(
+                    vectors=grpc.NamedVectors(
+                        vectors={
+                            # DenseVector: field 1 (data) packed float
+                            dense_name: grpc.Vector(dense=grpc.DenseVector.FromString(dense_header + dense[i].tobytes())),
+                            # SparseVector: field 1 (values) packed float, field 2 (indices) packed uint32
+                            sparse_name: grpc.Vector(sparse=grpc.SparseVector.FromString(
+                                b"\x0a" + encode_varint(len(sparse_values)) + sparse_values +
+                                b"\x12" + encode_varint(len(sparse_indices)) + sparse_indices
+                            )),
+                        }
+                    )
+                ),
+                payload={key: json_to_value(column[i]) for key, column in payload.items()}
+            )
+        )
+    return points
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+# Vectorized protobuf varint encoding of unsigned integers, returns the bytes and the number of bytes per value
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1 << shift)
+    offsets = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        mask = lengths > k
+        group = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (lengths[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[mask] + k] = group | more
+    return out, lengths
@@ -0,0 +1,98 @@
+from client_pool import ClientPool
+from search_strategies import STRATEGIES, build_request, search, search_batch, load_profile
+from search_batching import MicroBatcher
+from query_set import add_query_arguments, queries_from_args
+from load_test import closed_loop, write_results
+import numpy as np
+import os
+import argparse
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# Throughput of batched searches against one query_points request per query. The query set is turned into
+# requests up front, cycling through --strategies so the batches mix strategies. Every mode runs the
+# closed loop of load_test.py with --concurrency threads for --duration seconds:
+# - single: every thread sends one query_points request per query
+# - batch: every thread sends --batch-size requests at once through query_batch_points
+# - micro: every thread sends single requests through the MicroBatcher (search_batching.py), which groups
+#   the requests of all threads arriving within --window milliseconds into one query_batch_points call
+def report(mode, results, elapsed, queries_per_call, args, batcher=None):
+    latencies = np.asarray(results.latencies or [float("nan")]) * 1000
+    return {
+        "mode": mode,
+        "concurrency": args.concurrency,
+        "batch_size": queries_per_call if mode == "batch" else (batcher.mean_batch_size() if batcher else 1),
+        "qps": len(results.latencies) * queries_per_call / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "errors": dict(results.errors)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare single query_points requests with query_batch_points batches and micro-batching")
+    add_query_arguments(parser, num_queries=200, strategies=STRATEGIES)
+    parser.add_argument("--modes", default="single,batch,micro", help="Comma separated modes to run (default: single,batch,micro)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads sending requests (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Requests per query_batch_points call in the batch mode (default: 16)")
+    parser.add_argument("--window", type=float, default=2.0, help="Micro-batching window in milliseconds (default: 2)")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Upper bound for a micro-batch (default: 64)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per mode (default: 30)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds per mode before measuring (default: 5)")
+    parser.add_argument("--limit", type=int, default=5, help="Results per query (default: 5)")
+    args = parser.parse_args()
+
+    client = ClientPool.from_env()
+    collection_name = os.getenv("COLLECTION_NAME")
+    strategies = [strategy.strip() for strategy in args.strategies.split(",")]
+    queries = queries_from_args(args, client, collection_name)
+    profile = load_profile(args.profile)
+    requests = [
+        build_request(strategies[i % len(strategies)], query, limit=args.limit, **profile.get(strategies[i % len(strategies)], {}))
+        for i, query in enumerate(queries)
+    ]
+    batches = [requests[start:start + args.batch_size] for start in range(0, len(requests), args.batch_size)]
+    print(f"Benchmarking {len(requests)} requests ({', '.join(strategies)}) on {collection_name} with {len(client.clients)} node(s), concurrency {args.concurrency}")
+
+    rows = []
+    for mode in [mode.strip() for mode in args.modes.split(",")]:
+        batcher = None
+        if mode == "single":
+            items, queries_per_call = requests, 1
+            run = lambda request: search(client, collection_name, request)
+        elif mode == "batch":
+            # A trailing short batch would be counted as a full one, so only full batches are sent
+            items, queries_per_call = [batch for batch in batches if len(batch) == args.batch_size] or batches, args.batch_size
+            run = lambda batch: search_batch(client, collection_name, batch)
+        elif mode == "micro":
+            items, queries_per_call = requests, 1
+            batcher = MicroBatcher(client, collection_name, window=args.window / 1000, max_batch_size=args.max_batch_size)
+            run = batcher.search
+        else:
+            raise ValueError(f"Unknown mode {mode}, expected single, batch or micro")
+        if args.warmup > 0:
+            closed_loop(run, items, args.warmup, args.concurrency)
+            if batcher:
+                batcher.batch_sizes.clear()
+        row = report(mode, *closed_loop(run, items, args.duration, args.concurrency), queries_per_call, args, batcher)
+        if batcher:
+            batcher.close()
+        rows.append(row)
+        print(f"{mode}: {row['qps']:.1f} queries/s, {row['batch_size']:.1f} queries per call, p50 {row['p50_ms']:.2f}ms, "
+              f"p95 {row['p95_ms']:.2f}ms, p99 {row['p99_ms']:.2f}ms per call {row['errors'] or ''}")
+
+    single = next((row for row in rows if row["mode"] == "single"), None)
+    if single and single["qps"] > 0:
+        for row in rows:
+            if row is not single:
+                print(f"{row['mode']}: {row['qps'] / single['qps']:.2f}x the throughput of single requests")
+
+    if args.output:
+        write_results(args.output, rows)
+        print(f"Results written to {args.output}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from qdrant_client import models
+from client_pool import ClientPool
+from search_strategies import PREFETCH_LIMIT, build_request, search, user_filter, load_profile
+from search_quality import ground_truth, recall_at_k, mean, format_optional
+from client_fusion import RRF_K, fuse, fetch, higher_is_better
+from query_set import add_query_arguments, queries_from_args
+from load_test import write_results
+import numpy as np
+import os
+import time
+import argparse
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# Client-side fusion (client_fusion.py) against the fusion of Qdrant, on the dense and sparse prefetches of
+# the rrf strategy. For every method and query:
+# - server: one query_points request with both prefetches and the fusion query (rrf and dbsf only)
+# - client: both prefetches in one query_batch_points round trip, fused with NumPy
+# It reports the latency of both (and of the fusion step alone), the agreement of the client top k with the
+# server top k of the same method, and the recall@k of both against the exact ground truth of --truth.
+def branches(client, collection_name, query, prefetch_limit, params):
+    return [
+        (client, collection_name, build_request("dense", query, limit=prefetch_limit, **params).model_copy(update={"with_payload": False})),
+        (client, collection_name, build_request("sparse", query, limit=prefetch_limit).model_copy(update={"with_payload": False}))
+    ]
+
+def server_request(query, method, limit, prefetch_limit, k, params):
+    return models.QueryRequest(
+        prefetch=[
+            models.Prefetch(query=query["dense"], using="dense", limit=prefetch_limit, params=build_request("dense", query, **params).params),
+            models.Prefetch(query=query["sparse"], using="sparse", limit=prefetch_limit)
+        ],
+        query=models.RrfQuery(rrf=models.Rrf(k=k)) if method == "rrf" else models.FusionQuery(fusion=models.Fusion.DBSF),
+        filter=user_filter(query["user_id"]),
+        limit=limit,
+        with_payload=False
+    )
+
+def benchmark_method(client, collection_name, method, queries, truth, args, params, directions):
+    server_latencies, client_latencies, fuse_latencies = [], [], []
+    agreements, server_recalls, client_recalls = [], [], []
+    for query, expected in zip(queries, truth):
+        server_ids = None
+        if method != "weighted":
+            started = time.perf_counter()
+            response = search(client, collection_name, server_request(query, method, args.limit, args.prefetch_limit, args.rrf_k, params))
+            server_latencies.append(time.perf_counter() - started)
+            server_ids = [str(point.id) for point in response.points]
+            server_recalls.append(recall_at_k(server_ids, expected, args.limit))
+
+        started = time.perf_counter()
+        result_lists = fetch(branches(client, collection_name, query, args.prefetch_limit, params))
+        fetched = time.perf_counter()
+        client_ids, _ = fuse(result_lists, method, args.limit, args.weights, args.rrf_k, directions)
+        done = time.perf_counter()
+        client_latencies.append(done - started)
+        fuse_latencies.append(done - fetched)
+        client_recalls.append(recall_at_k(client_ids, expected, args.limit))
+        if server_ids is not None:
+            agreements.append(recall_at_k(client_ids, server_ids, args.limit))
+
+    def milliseconds(latencies, p):
+        return float(np.percentile(np.asarray(latencies) * 1000, p)) if latencies else None
+
+    return {
+        "method": method,
+        "server_p50_ms": milliseconds(server_latencies, 50),
+        "server_p95_ms": milliseconds(server_latencies, 95),
+        "client_p50_ms": milliseconds(client_latencies, 50),
+        "client_p95_ms": milliseconds(client_latencies, 95),
+        "fuse_mean_us": float(np.mean(fuse_latencies) * 1e6),
+        "agreement": mean(agreements),
+        "server_recall": mean(server_recalls),
+        "client_recall": mean(client_recalls)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare client-side fusion (RRF, DBSF, weighted) with the server-side fusion of Qdrant")
+    parser.add_argument("--methods", default="rrf,dbsf,weighted", help="Comma separated fusion methods (default: rrf,dbsf,weighted)")
+    add_query_arguments(parser)
+    parser.add_argument("--limit", type=int, default=10, help="Fused results per query, agreement and recall are measured at this k (default: 10)")
+    parser.add_argument("--prefetch-limit", type=int, default=PREFETCH_LIMIT, help=f"Candidates per prefetch (default: {PREFETCH_LIMIT})")
+    parser.add_argument("--rrf-k", type=int, default=RRF_K, help=f"Constant k of reciprocal rank fusion, on both sides (default: {RRF_K})")
+    parser.add_argument("--weights", type=lambda text: [float(weight) for weight in text.split(",")], help="Dense and sparse weights of the client-side fusion, like 0.7,0.3 (default: equal)")
+    parser.add_argument("--truth", default="rrf", help="Strategy whose exact results are the ground truth, or dense (default: rrf)")
+    parser.add_argument("--ground-truth-cache", help="JSON file the ground truth is cached in (default: .cache/ground_truth/<COLLECTION_NAME>.json)")
+    args = parser.parse_args()
+
+    client = ClientPool.from_env()
+    collection_name = os.getenv("COLLECTION_NAME")
+    queries = queries_from_args(args, client, collection_name)
+    params = {name: value for name, value in load_profile(args.profile).get("rrf", {}).items() if name == "hnsw_ef"}
+    truth = ground_truth(client, collection_name, args.truth, queries, args.limit, args.ground_truth_cache)
+    # The dense scores are distances with the Euclid distance of the uint8 profile, sparse scores are always higher-is-better
+    directions = [higher_is_better(client.get_collection(collection_name).config.params.vectors["dense"].distance), True]
+
+    # One untimed round, so the first method does not pay for a cold cache
+    for query in queries:
+        fetch(branches(client, collection_name, query, args.prefetch_limit, params))
+
+    rows = []
+    for method in [method.strip() for method in args.methods.split(",")]:
+        row = benchmark_method(client, collection_name, method, queries, truth, args, params, directions)
+        rows.append(row)
+        print(
+            f"{method}: server p50 {format_optional(row['server_p50_ms'], '{:.2f}ms')} p95 {format_optional(row['server_p95_ms'], '{:.2f}ms')}, "
+            f"client p50 {row['client_p50_ms']:.2f}ms p95 {row['client_p95_ms']:.2f}ms (fusion {row['fuse_mean_us']:.0f}us), "
+            f"agreement@{args.limit} {format_optional(row['agreement'], '{:.3f}')}, "
+            f"recall@{args.limit} server {format_optional(row['server_recall'], '{:.3f}')} client {format_optional(row['client_recall'], '{:.3f}')}"
+        )
+
+    if args.output:
+        write_results(args.output, rows)
+        print(f"Results written to {args.output}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+from qdrant_client import QdrantClient, models, grpc
+from prometheus_client import REGISTRY
+from dbpedia_cache import DbpediaCache, CacheRange, DENSE_FIELD, DENSE_SIZE
+from checkpoint import Checkpoint
+from adaptive import AimdController
+from memory_budget import ByteBudget, MemorySampler
+from embedding_models import HashingSparseEmbedding
+import dbpedia_ingest_points_parallel as ingest
+import numpy as np
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+# Client-side ceiling of the ingest pipeline: the same stream_and_ingest as dbpedia_ingest_points_parallel.py
+# (reading, sparse embeddings, point construction, serialization), but the points end up in a sink instead of a cluster.
+# Comparing its points/s with a real ingestion tells whether the client or the cluster is the bottleneck.
+# - noop sink: serializes every upsert request like the client would (protobuf for gRPC, JSON for REST) and drops it
+# - memory sink: QdrantClient(":memory:"), the local mode of qdrant-client, which stores the points in process
+# With synthetic rows (the default without --cache) and the hashing embedder nothing needs the network, so it runs on a CI box and
+# --min-points-per-second turns it into a regression check of the Python hot path.
+
+# Upserts are serialized into the request body the client would send, then dropped
+class NoopSink:
+    def __init__(self, prefer_grpc=True):
+        self.init_options = {"prefer_grpc": prefer_grpc}
+
+    def upsert(self, collection_name, points, wait=True, **kwargs):
+        if isinstance(points, list):
+            grpc.UpsertPoints(collection_name=collection_name, wait=wait, points=points).SerializeToString()
+        else:
+            models.PointsBatch(batch=points).model_dump_json(exclude_unset=True)
+
+    def close(self):
+        pass
+
+# The local mode is not thread safe, the upload workers take turns
+class LockedClient:
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+
+    @property
+    def init_options(self):
+        return self.client.init_options
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        def locked(*args, **kwargs):
+            with self.lock:
+                return method(*args, **kwargs)
+        return locked
+
+# Initializer of the embedding processes with the hashing stand-in of the SPLADE model (see embedding_models.py),
+# so the benchmark measures the pipeline and not the model
+def init_hashing_model(threads, cache_path=None, pruning=None):
+    ingest.sparse_model = HashingSparseEmbedding()
+    ingest.sparse_pruning = pruning
+
+# Rows in the shape of the streamed dataset, with the dense vectors as Python lists like the stream delivers them.
+# A pool of distinct vectors is generated up front, so generating rows costs (almost) nothing.
+def synthetic_rows(count, pool_size=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(pool_size, DENSE_SIZE)).astype(np.float32)
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+    words = [f"word{i}" for i in range(5000)]
+    text_rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "_id": f"<dbpedia:Synthetic_{i}>",
+            "title": f"Synthetic {i}",
+            "text": " ".join(text_rng.choices(words, k=60)),
+            DENSE_FIELD: vectors[i % pool_size]
+        }
+
+def create_sink(sink, wire):
+    if sink == "noop":
+        return NoopSink(prefer_grpc=wire == "grpc")
+    client = LockedClient(QdrantClient(":memory:"))
+    ingest.create_collection(client, "benchmark", shard_number=1, replication_factor=1)
+    return client
+
+# Seconds per batch of every pipeline stage, from the histograms of ingest_metrics.py
+def stage_seconds():
+    stages = {}
+    for stage in ("read", "embed", "serialize", "upsert"):
+        total = REGISTRY.get_sample_value(f"ingest_{stage}_seconds_sum") or 0.0
+        count = REGISTRY.get_sample_value(f"ingest_{stage}_seconds_count") or 0.0
+        stages[stage] = total / count if count else 0.0
+    return stages
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the client-side throughput ceiling of the ingest pipeline without a cluster")
+    parser.add_argument("--sink", choices=["noop", "memory"], default="noop", help="Where the points go: dropped after serialization, or into QdrantClient(':memory:') (default: noop)")
+    parser.add_argument("--wire", choices=["grpc", "rest"], default="grpc", help="Request format the noop sink serializes, the memory sink always takes REST batches (default: grpc)")
+    parser.add_argument("--points", type=int, default=20000, help="Number of points to push through the pipeline (default: 20000)")
+    parser.add_argument("--cache", help="Read the rows from a local cache created by dbpedia_cache.py instead of generating them")
+    parser.add_argument("--embedder", choices=["hashing", "splade"], default="hashing", help="Sparse embeddings from the hashing stand-in or from the real SPLADE model (default: hashing)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BATCH_SIZE", 200)), help="Points per batch (default: BATCH_SIZE or 200)")
+    parser.add_argument("--embed-workers", type=int, default=int(os.getenv("EMBED_WORKERS", 2)), help="Embedding processes (default: EMBED_WORKERS or 2)")
+    parser.add_argument("--upload-workers", type=int, default=int(os.getenv("UPLOAD_WORKERS", 6)), help="Upload threads (default: UPLOAD_WORKERS or 6)")
+    parser.add_argument("--max-inflight-mb", type=float, default=os.getenv("MAX_INFLIGHT_MB"), help="Bound the estimated bytes of the batches in flight (default: MAX_INFLIGHT_MB, unbounded when unset)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Trace the Python heap next to the RSS")
+    parser.add_argument("--output", help="Write the result to this JSON file")
+    parser.add_argument("--min-points-per-second", type=float, help="Exit with 1 when the throughput stays below this, for CI")
+    args = parser.parse_args()
+
+    if args.cache:
+        dataset = CacheRange(DbpediaCache(args.cache), stop=args.points)
+    else:
+        dataset = synthetic_rows(args.points)
+    embed_threads = max(1, os.cpu_count() // args.embed_workers)
+    initializer = init_hashing_model if args.embedder == "hashing" else ingest.init_sparse_model
+    embed_pool = ingest.create_embed_pool(args.embed_workers, embed_threads, initializer=initializer)
+    controller = AimdController.fixed(args.batch_size, args.upload_workers)
+    sink = create_sink(args.sink, args.wire)
+    budget = ByteBudget(int(float(args.max_inflight_mb) * 2**20)) if args.max_inflight_mb else None
+
+    with tempfile.TemporaryDirectory() as directory, MemorySampler(interval=0.2, trace=args.tracemalloc) as memory:
+        checkpoint = Checkpoint(os.path.join(directory, "checkpoint.json"))
+        started = time.perf_counter()
+        ingest.stream_and_ingest(sink, "benchmark", dataset, checkpoint, controller, embed_pool, 64, args.upload_workers * 2, 0, budget=budget, memory=memory)
+        seconds = time.perf_counter() - started
+
+    result = {
+        "sink": args.sink,
+        "wire": args.wire if args.sink == "noop" else "rest",
+        "embedder": args.embedder,
+        "dataset": "cache" if args.cache else "synthetic",
+        "points": checkpoint.offset,
+        "seconds": seconds,
+        "points_per_second": checkpoint.offset / seconds,
+        "seconds_per_batch": stage_seconds(),
+        "peak_rss_bytes": memory.peak_rss,
+        "peak_python_heap_bytes": memory.peak_traced if args.tracemalloc else None,
+        "peak_in_flight_bytes": budget.peak if budget else None
+    }
+    sink.close()
+    print(f"{result['points']} points in {seconds:.1f}s: {result['points_per_second']:.0f} points/s ({result['sink']} sink, {result['wire']}, {result['embedder']} embedder)")
+    print(f"Memory: {memory.summary()}" + (f", peak in flight {budget.peak / 2**20:.0f} MiB" if budget else ""))
+    print("Seconds per batch: " + ", ".join(f"{stage} {value * 1000:.1f}ms" for stage, value in result["seconds_per_batch"].items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.min_points_per_second and result["points_per_second"] < args.min_points_per_second:
+        print(f"Throughput below the minimum of {args.min_points_per_second:.0f} points/s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+from qdrant_client import models
+from datasets import load_dataset
+from client_pool import ClientPool
+from dbpedia_cache import DbpediaCache, DATASET_NAME, DENSE_FIELD
+from storage_profiles import PROFILES, dense_vector_params, quantization_config, encode_dense, encode_query
+from bulk_load import wait_for_index
+import numpy as np
+import os
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# Benchmark of the dense storage profiles (see storage_profiles.py). For every profile a collection
+# <COLLECTION_NAME>_<profile> is loaded with the first --points rows, the --queries rows after them are the queries.
+# Per profile it reports:
+# - disk footprint: vectors_size_bytes of all shard replicas according to the telemetry of every node, next to
+#   the raw size of the dense vectors (points x 1536 x bytes per dimension)
+# - search latency (p50/p95) with rescoring, and without rescoring for the profiles with binary quantization,
+#   the difference is what reading the original vectors from disk costs
+# - recall@k against an exact float32 cosine search done with numpy on the same rows
+def load_rows(cache_path, points, queries):
+    if cache_path:
+        dense = DbpediaCache(cache_path).dense
+        return np.asarray(dense[:points], dtype=np.float32), np.asarray(dense[points:points + queries], dtype=np.float32)
+    rows = [item[DENSE_FIELD] for item in load_dataset(DATASET_NAME, split="train", streaming=True).take(points + queries)]
+    dense = np.asarray(rows, dtype=np.float32)
+    return dense[:points], dense[points:]
+
+def exact_top_k(dense, queries, k):
+    dense = dense / np.linalg.norm(dense, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ dense.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+def create_benchmark_collection(client, collection_name, profile):
+    client.delete_collection(collection_name=collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={"dense": dense_vector_params(profile)},
+        quantization_config=quantization_config(profile),
+        metadata={"storage_profile": profile}
+    )
+
+# Size of the stored vectors of a collection, summed over the local shards of every node
+def vectors_size_bytes(client, collection_name):
+    total = 0
+    for node in getattr(client, "clients", [client]):
+        telemetry = node.http.service_api.telemetry(details_level=3).result
+        for collection in telemetry.collections.collections or []:
+            if getattr(collection, "id", None) != collection_name:
+                continue
+            for shard in collection.shards or []:
+                if shard.local and shard.local.vectors_size_bytes:
+                    total += shard.local.vectors_size_bytes
+    return total
+
+def search(client, collection_name, profile, queries, k, rescore):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        response = client.query_points(
+            collection_name=collection_name,
+            query=encode_query(profile, query),
+            using="dense",
+            limit=k,
+            search_params=models.SearchParams(
+                quantization=models.QuantizationSearchParams(
+                    ignore=False,
+                    rescore=rescore,
+                    oversampling=3.0,
+                )
+            )
+        )
+        latencies.append(time.perf_counter() - started)
+        results.append({point.id for point in response.points})
+    return latencies, results
+
+def recall(results, truth):
+    return float(np.mean([len(found & expected) / len(expected) for found, expected in zip(results, truth)]))
+
+def percentiles(latencies):
+    return {f"p{p}_ms": float(np.percentile(latencies, p) * 1000) for p in (50, 95)}
+
+def benchmark_profile(client, collection_name, profile, dense, queries, truth, k):
+    create_benchmark_collection(client, collection_name, profile)
+    started = time.perf_counter()
+    client.upload_collection(
+        collection_name=collection_name,
+        vectors={"dense": encode_dense(profile, dense)},
+        ids=range(len(dense)),
+        batch_size=256,
+        wait=True
+    )
+    wait_for_index(client, collection_name, interval=2.0, log=lambda message: None)
+    result = {
+        "profile": profile,
+        "load_seconds": time.perf_counter() - started,
+        "raw_vector_bytes": dense.shape[0] * dense.shape[1] * np.dtype(profile).itemsize,
+        "vectors_size_bytes": vectors_size_bytes(client, collection_name),
+    }
+
+    # One untimed round warms up the page cache the same way for every profile
+    search(client, collection_name, profile, queries, k, rescore=True)
+    latencies, results = search(client, collection_name, profile, queries, k, rescore=True)
+    result["rescore"] = {**percentiles(latencies), "recall": recall(results, truth)}
+    if PROFILES[profile]["binary_quantization"]:
+        latencies, results = search(client, collection_name, profile, queries, k, rescore=False)
+        result["no_rescore"] = {**percentiles(latencies), "recall": recall(results, truth)}
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare disk footprint, rescore latency and recall of the dense storage profiles")
+    parser.add_argument("--cache", help="Read the rows from a local cache created by dbpedia_cache.py instead of streaming them")
+    parser.add_argument("--points", type=int, default=100000, help="Points per collection (default: 100000)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries (default: 200)")
+    parser.add_argument("--k", type=int, default=10, help="Results per query, recall is measured at k (default: 10)")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"Comma separated profiles (default: {','.join(PROFILES)})")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections afterwards")
+    args = parser.parse_args()
+
+    client = ClientPool.from_env()
+    dense, queries = load_rows(args.cache, args.points, args.queries)
+    truth = exact_top_k(dense, queries, args.k)
+
+    results = []
+    for profile in args.profiles.split(","):
+        collection_name = f"{os.getenv('COLLECTION_NAME')}_{profile}"
+        print(f"Benchmarking {profile} on {collection_name} with {len(dense)} points and {len(queries)} queries")
+        result = benchmark_profile(client, collection_name, profile, dense, queries, truth, args.k)
+        results.append(result)
+        line = (
+            f"  {profile}: vectors {result['vectors_size_bytes'] / 2**20:.1f} MiB (raw dense {result['raw_vector_bytes'] / 2**20:.1f} MiB), "
+            f"rescore p50 {result['rescore']['p50_ms']:.2f}ms p95 {result['rescore']['p95_ms']:.2f}ms recall@{args.k} {result['rescore']['recall']:.3f}"
+        )
+        if "no_rescore" in result:
+            line += f", without rescore p50 {result['no_rescore']['p50_ms']:.2f}ms recall@{args.k} {result['no_rescore']['recall']:.3f}"
+        print(line)
+        if not args.keep:
+            client.delete_collection(collection_name=collection_name)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from qdrant_client import models
+from payload_projection import create_payload_indexes
+import os
+import time
+
+# Bulk loading: the shortest way to a fully indexed collection is to not index anything while loading.
+# - The collection is created with HNSW m=0, so no graph is built for the points coming in
+# - suspend_indexing sets indexing_threshold=0, so the optimizers do not build vector indexes (or move vectors
+#   into indexed segments) during the load, they only merge segments. The threshold it replaces is kept in the
+#   collection metadata, so a resumed load and the coordinator of a sharded load restore the original one.
+# - Upserts are sent with wait=False: Qdrant acknowledges them once they are in the WAL, without waiting for
+#   them to be applied, so the uploads never wait on the segments
+# - restore_indexing switches HNSW and indexing back on, and all segments are indexed in one go
+# - wait_for_index follows the optimizers until the collection is green
+# finish_load runs the whole end of a load, for a single ingest process and for ingest_coordinator.py alike.
+#
+# indexing_threshold is in kilobytes of vectors, 20000 is the Qdrant default.
+DEFAULT_INDEXING_THRESHOLD = 20000
+
+def suspend_indexing(client, collection_name):
+    info = client.get_collection(collection_name)
+    # A resumed load finds indexing suspended already, the threshold stored by the first run stays
+    if info.config.optimizer_config.indexing_threshold and "indexing_threshold" not in (info.config.metadata or {}):
+        client.update_collection(collection_name=collection_name, metadata={"indexing_threshold": info.config.optimizer_config.indexing_threshold})
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0)
+    )
+
+# The threshold suspend_indexing replaced, INDEXING_THRESHOLD when the collection has none stored
+def original_indexing_threshold(client, collection_name):
+    metadata = client.get_collection(collection_name).config.metadata or {}
+    return metadata.get("indexing_threshold") or int(os.getenv("INDEXING_THRESHOLD", DEFAULT_INDEXING_THRESHOLD))
+
+def restore_indexing(client, collection_name, m=16, indexing_threshold=None):
+    client.update_collection(
+        collection_name=collection_name,
+        hnsw_config=models.HnswConfigDiff(m=m),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold) if indexing_threshold else None
+    )
+
+# Every point has one vector per named dense vector to index, sparse vectors are indexed on arrival
+def expected_vectors(info):
+    vectors = info.config.params.vectors
+    return (info.points_count or 0) * (len(vectors) if isinstance(vectors, dict) else 1)
+
+# Replica states of every shard, asked from every node of a client pool so the point count of every replica is known
+def shard_states(client, collection_name):
+    states = {}
+    for node in getattr(client, "clients", [client]):
+        cluster_info = node.collection_cluster_info(collection_name)
+        for shard in cluster_info.local_shards:
+            states[(shard.shard_id, shard.shard_key, cluster_info.peer_id)] = f"{shard.state} ({shard.points_count} points)"
+        for shard in cluster_info.remote_shards:
+            states.setdefault((shard.shard_id, shard.shard_key, shard.peer_id), str(shard.state))
+    return states
+
+def format_shards(states):
+    return ", ".join(
+        f"shard {shard_id}{'/' + str(shard_key) if shard_key is not None else ''}@{peer_id}: {state}"
+        for (shard_id, shard_key, peer_id), state in sorted(states.items(), key=lambda item: str(item[0]))
+    )
+
+def format_seconds(seconds):
+    return time.strftime("%H:%M:%S", time.gmtime(seconds))
+
+# Wait until the collection is green and no updates are queued anymore, reporting every interval seconds:
+# - indexed_vectors_count against the dense vectors of all points (segments smaller than indexing_threshold
+#   are never indexed, so the progress does not always reach 100%)
+# - an ETA based on the indexing rate since the waiter started
+# - the optimizer status, the queued updates (wait=False upserts not applied yet) and the state of every shard replica
+# Qdrant has no notification for a finished optimization, so the collection info is polled.
+def wait_for_index(client, collection_name, interval=5.0, log=print):
+    started = time.monotonic()
+    first_indexed = None
+    while True:
+        info = client.get_collection(collection_name)
+        indexed, expected = info.indexed_vectors_count or 0, expected_vectors(info)
+        queued = info.update_queue.length if info.update_queue else 0
+        elapsed = time.monotonic() - started
+        first_indexed = indexed if first_indexed is None else first_indexed
+        rate = (indexed - first_indexed) / elapsed if elapsed > 0 else 0
+        eta = format_seconds((expected - indexed) / rate) if rate > 0 and expected > indexed else "unknown"
+
+        log(
+            f"Indexing status: {info.status}, optimizer: {info.optimizer_status}, "
+            f"indexed vectors: {indexed}/{expected} ({indexed / expected if expected else 1:.1%}), "
+            f"queued updates: {queued}, ETA: {eta}, elapsed: {format_seconds(elapsed)}"
+        )
+        try:
+            log(f"Shards: {format_shards(shard_states(client, collection_name))}")
+        except Exception as e:
+            # Local mode and single node setups without cluster mode have no cluster info
+            log(f"Shards: unavailable ({e.__class__.__name__})")
+
+        if info.status == models.CollectionStatus.GREEN and queued == 0:
+            log(f"Indexing complete after {format_seconds(elapsed)}.")
+            return info
+        time.sleep(interval)
+
+# Mark the data of the collection as changed once a load is done, the result caches of the searches
+# (see result_cache.py) drop their entries on their next version check
+def bump_data_version(client, collection_name):
+    client.update_collection(collection_name=collection_name, metadata={"data_version": time.time()})
+
+# End of a load: build the payload indexes that were deferred until after the load, enable HNSW graph construction
+# (and indexing again after a bulk load, with indexing_threshold), wait for the indexation to finish, bump the
+# data version for the result caches (see result_cache.py) and, with snapshot, store shard snapshots so later
+# benchmark cycles can restore them instead of ingesting again
+def finish_load(client, collection_name, indexing_threshold=None, snapshot=False):
+    create_payload_indexes(client, collection_name)
+    restore_indexing(client, collection_name, m=16, indexing_threshold=indexing_threshold)
+    print(f"Number of vectors in collection: {client.get_collection(collection_name).points_count}")
+    wait_for_index(client, collection_name, interval=float(os.getenv("INDEX_POLL_INTERVAL", 5)))
+    bump_data_version(client, collection_name)
+    if snapshot:
+        # dbpedia_snapshot.py imports this module
+        import dbpedia_snapshot
+        dbpedia_snapshot.create(client, collection_name, dbpedia_snapshot.snapshot_dir(collection_name))
@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import threading
+
+# Keeps track of the stream offset up to which every batch has been acknowledged by Qdrant.
+# Batches finish out of order, so the offset only moves over a contiguous run of finished batches
+# and everything after it gets ingested again on resume (which is harmless thanks to the deterministic ids).
+# The offset counts from the start of the dataset slice of this worker. Next to it the checkpoint holds
+# the progress of the worker (its slice, when this run started and whether it is done), which is what
+# ingest_coordinator.py merges into one summary.
+class Checkpoint:
+    def __init__(self, path, offset=0, worker_index=0, num_workers=1, rows=None):
+        self.path = path
+        self.offset = offset
+        self.worker_index = worker_index
+        self.num_workers = num_workers
+        self.rows = rows
+        self.run_offset = offset
+        self.run_started = time.time()
+        self.done = False
+        self.next_batch = 0
+        self.finished = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        if not os.path.exists(path):
+            return cls(path, **kwargs)
+        with open(path) as f:
+            return cls(path, json.load(f)["offset"], **kwargs)
+
+    # The checkpoint of a worker: .checkpoints/<collection name>.json, or <collection name>.<i>-of-<n>.json with several workers
+    @staticmethod
+    def default_path(collection_name, worker_index=0, num_workers=1):
+        suffix = f".{worker_index}-of-{num_workers}" if num_workers > 1 else ""
+        return os.path.join(".checkpoints", f"{collection_name}{suffix}.json")
+
+    # Batch indexes count from the offset this run started at
+    def ack(self, batch_index, rows):
+        with self.lock:
+            self.finished[batch_index] = rows
+            if self.next_batch not in self.finished:
+                return
+            while self.next_batch in self.finished:
+                self.offset += self.finished.pop(self.next_batch)
+                self.next_batch += 1
+            self.save()
+
+    def finish(self):
+        with self.lock:
+            self.done = True
+            self.save()
+
+    # Write to a temporary file first, so a crash never leaves a half written checkpoint behind
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({
+                "offset": self.offset,
+                "worker_index": self.worker_index,
+                "num_workers": self.num_workers,
+                "rows": self.rows,
+                "run_offset": self.run_offset,
+                "run_started": self.run_started,
+                "updated": time.time(),
+                "done": self.done
+            }, f)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,93 @@
+from qdrant_client import models
+from search_strategies import search_batch
+import numpy as np
+
+# Qdrant's default constant of reciprocal rank fusion
+RRF_K = 2
+
+# Euclid and Manhattan scores are distances, the lower the better, the other distances and sparse vectors
+# score higher for better matches
+LOWER_IS_BETTER = {models.Distance.EUCLID, models.Distance.MANHATTAN}
+
+def higher_is_better(distance):
+    return distance not in LOWER_IS_BETTER
+
+# Client-side fusion of ranked result lists, vectorized with NumPy. The server fuses the prefetches of one
+# query in one collection, here the lists may come from any named vector, collection or cluster.
+# Every method turns the lists into one array of point ids and one array of contributions, and sums the
+# contributions per point in a single np.bincount over all lists:
+# - rrf: 1 / (rank / weight + k - 1) with rank starting at 1, the formula of Qdrant, k tunable
+# - dbsf: distribution-based score fusion like Qdrant, every list normalized with mean +- 3 standard deviations
+# - weighted: a weighted sum of the min-max normalized scores of every list
+# A result list is a list of ScoredPoint (the points of a QueryResponse). higher_is_better has a flag per list,
+# the scores of a list searched with a distance (see higher_is_better()) are negated before dbsf and weighted
+# normalize them, rrf only looks at the ranks. Returns the fused ids and scores, best first.
+def fuse(result_lists, method="rrf", limit=10, weights=None, k=RRF_K, higher_is_better=None):
+    weights = np.ones(len(result_lists)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(weights) != len(result_lists):
+        raise ValueError(f"{len(weights)} weights for {len(result_lists)} result lists")
+    higher_is_better = [True] * len(result_lists) if higher_is_better is None else higher_is_better
+    if len(higher_is_better) != len(result_lists):
+        raise ValueError(f"{len(higher_is_better)} score directions for {len(result_lists)} result lists")
+    ids, contributions = [], []
+    for points, weight, higher in zip(result_lists, weights, higher_is_better):
+        if not points or weight <= 0:
+            continue
+        scores = np.fromiter((point.score for point in points), dtype=np.float64, count=len(points))
+        if not higher:
+            scores = -scores
+        ids += [point.id for point in points]
+        if method == "rrf":
+            contributions.append(1.0 / (np.arange(1, len(points) + 1) / weight + k - 1))
+        elif method == "dbsf":
+            contributions.append(weight * dbsf_normalize(scores))
+        elif method == "weighted":
+            contributions.append(weight * minmax_normalize(scores))
+        else:
+            raise ValueError(f"Unknown fusion method {method}, expected rrf, dbsf or weighted")
+    if not ids:
+        return [], np.empty(0)
+    unique, inverse = np.unique(np.asarray([str(point_id) for point_id in ids]), return_inverse=True)
+    fused = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(unique))
+    top = np.argsort(-fused, kind="stable")[:limit]
+    return unique[top].tolist(), fused[top]
+
+def dbsf_normalize(scores):
+    if len(scores) == 1:
+        return np.full(1, 0.5)
+    std = scores.std(ddof=1)
+    if std == 0:
+        return np.full(len(scores), 0.5)
+    low = scores.mean() - 3 * std
+    return (scores - low) / (6 * std)
+
+def minmax_normalize(scores):
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.ones(len(scores))
+
+# Runs the prefetch branches and returns their result lists. A branch is a (client, collection_name, request)
+# tuple, the branches of the same client and collection go out as one query_batch_points round trip,
+# and with an executor the round trips to different collections or clusters run in parallel.
+def fetch(branches, executor=None):
+    groups = {}
+    for i, (client, collection_name, request) in enumerate(branches):
+        groups.setdefault((id(client), collection_name), (client, collection_name, []))[2].append((i, request))
+
+    def run(group):
+        client, collection_name, requests = group
+        responses = search_batch(client, collection_name, [request for _, request in requests])
+        return [(i, response.points) for (i, _), response in zip(requests, responses)]
+
+    result_lists = [None] * len(branches)
+    if len(groups) == 1 or executor is None:
+        done = map(run, groups.values())
+    else:
+        done = executor.map(run, groups.values())
+    for group in done:
+        for i, points in group:
+            result_lists[i] = points
+    return result_lists
+
+# Fetch and fuse in one call, the fused ids and scores best first
+def fused_search(branches, method="rrf", limit=10, weights=None, k=RRF_K, executor=None, higher_is_better=None):
+    return fuse(fetch(branches, executor), method, limit, weights, k, higher_is_better)
@@ -0,0 +1,130 @@
+from qdrant_client import QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException
+from urllib.parse import urlparse
+import grpc
+import os
+import time
+import zlib
+import itertools
+import threading
+
+# Pool of clients, one per Qdrant node, so requests are not all coordinated and forwarded by a single node.
+# - Every QdrantClient method can be called on the pool, each call goes to the next healthy node (round robin)
+# - A node that is unreachable is skipped for cooldown seconds and the call fails over to the next node,
+#   call_async does the same for async clients (one per node, like the async ingestion uses)
+# - With custom sharding, every node holds its own shard key and points are sent straight to the node holding them
+#
+# The nodes are read from QDRANT_HOSTS (comma separated REST urls), falling back to QDRANT_HOST.
+# The gRPC port of a node is its REST port + 1, like 6333/6334, 7333/7334 and 8333/8334 in docker-compose.yaml.
+class ClientPool:
+    def __init__(self, urls, prefer_grpc=True, cooldown=10.0, log=print):
+        self.urls = urls
+        self.clients = [
+            QdrantClient(url=url, grpc_port=(urlparse(url).port or 6333) + 1, prefer_grpc=prefer_grpc)
+            for url in urls
+        ]
+        self.cooldown = cooldown
+        self.log = log
+        self.retry_at = [0.0] * len(urls)
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        # Shard key -> index of the node holding it
+        self.shard_keys = {}
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        hosts = os.getenv("QDRANT_HOSTS") or os.getenv("QDRANT_HOST")
+        return cls([host.strip() for host in hosts.split(",") if host.strip()], **kwargs)
+
+    # Options of the underlying clients, used by batch_upload.py to pick the gRPC path
+    @property
+    def init_options(self):
+        return self.clients[0].init_options
+
+    # Node indexes to try in order: the preferred node (or the next one in round robin) first,
+    # nodes in their cooldown last, so a call is still attempted when every node seems down
+    def candidates(self, prefer=None):
+        with self.lock:
+            start = next(self.counter) if prefer is None else prefer
+        order = [(start + i) % len(self.clients) for i in range(len(self.clients))]
+        now = time.monotonic()
+        return [i for i in order if self.retry_at[i] <= now] + [i for i in order if self.retry_at[i] > now]
+
+    # Run fn(client) against a node, failing over to the next node when the node cannot be reached
+    def call(self, fn, prefer=None):
+        error = None
+        for i in self.candidates(prefer):
+            try:
+                return fn(self.clients[i])
+            except (grpc.RpcError, ResponseHandlingException) as e:
+                if not is_unavailable(e):
+                    raise
+                self.mark_unavailable(i, e)
+                error = e
+        raise error
+
+    # Async variant of call: await fn(client) with the async client of a node, async_clients has one per node
+    # in the order of the pool. The nodes in cooldown are shared with the sync calls.
+    async def call_async(self, async_clients, fn, prefer=None):
+        error = None
+        for i in self.candidates(prefer):
+            try:
+                return await fn(async_clients[i])
+            except (grpc.RpcError, ResponseHandlingException) as e:
+                if not is_unavailable(e):
+                    raise
+                self.mark_unavailable(i, e)
+                error = e
+        raise error
+
+    def mark_unavailable(self, i, error):
+        if self.retry_at[i] <= time.monotonic():
+            self.log(f"Node {self.urls[i]} is unavailable, failing over for {self.cooldown:.0f}s ({error.__class__.__name__})")
+        self.retry_at[i] = time.monotonic() + self.cooldown
+
+    # Any other attribute is a QdrantClient method, called on the next healthy node
+    def __getattr__(self, name):
+        if name.startswith("_") or not callable(getattr(QdrantClient, name, None)):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(lambda client: getattr(client, name)(*args, **kwargs))
+
+    # Custom sharding: create one shard key per node, placed on the peer of that node (and on the next
+    # peers for the other replicas). The collection has to be created with ShardingMethod.CUSTOM.
+    def create_shard_keys(self, collection_name, shards_number, replication_factor):
+        peers = [client.http.cluster_api.cluster_status().result.peer_id for client in self.clients]
+        for i in range(len(peers)):
+            self.clients[0].create_shard_key(
+                collection_name=collection_name,
+                shard_key=shard_key_name(i),
+                shards_number=shards_number,
+                replication_factor=replication_factor,
+                placement=[peers[(i + r) % len(peers)] for r in range(replication_factor)]
+            )
+        self.use_shard_keys()
+
+    # Shard keys are named after the position of the node in QDRANT_HOSTS, so an existing collection
+    # can be used again (for example on --resume) without asking the cluster
+    def use_shard_keys(self):
+        self.shard_keys = {shard_key_name(i): i for i in range(len(self.clients))}
+
+    # The shard key of a point only depends on its id, so ingesting it again never puts it in a second shard
+    def shard_key_for(self, point_id):
+        keys = list(self.shard_keys)
+        return keys[zlib.crc32(str(point_id).encode()) % len(keys)]
+
+    # Run fn(client, shard_key) on the node holding the shard key, failing over to the other nodes
+    def call_shard(self, shard_key, fn):
+        return self.call(lambda client: fn(client, shard_key), prefer=self.shard_keys[shard_key])
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+def shard_key_name(index):
+    return f"node{index + 1}"
+
+# Connection errors mean the node is down or unreachable, anything else (bad request, ...) is raised as is
+def is_unavailable(error):
+    if isinstance(error, grpc.RpcError):
+        return error.code() == grpc.StatusCode.UNAVAILABLE
+    return True
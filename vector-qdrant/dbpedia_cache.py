@@ -0,0 +1,121 @@
+from datasets import load_dataset
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+import json
+import argparse
+from tqdm import tqdm
+
+DATASET_NAME = "Qdrant/dbpedia-entities-openai3-text-embedding-3-large-1536-1M"
+DENSE_FIELD = "text-embedding-3-large-1536-embedding"
+DENSE_SIZE = 1536
+DATASET_ROWS = 1000000
+
+# Local copy of the dbpedia dataset:
+# - dense.npy: float32 matrix with one row per point, read through a memory map
+# - payload.parquet: all other columns (_id, title, text), read through a memory mapped Arrow table
+# - meta.json: number of rows and dimensions
+# Slicing either of them does not copy data, so loading a batch is bound by the disk instead of Python.
+class DbpediaCache:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.path = path
+        self.dense = np.load(os.path.join(path, "dense.npy"), mmap_mode="r")[:meta["rows"]]
+        self.payload = pq.read_table(os.path.join(path, "payload.parquet"), memory_map=True)
+
+    def __len__(self):
+        return self.dense.shape[0]
+
+    # Yields (dense, payload) slices: a float32 memmap view and an Arrow table slice
+    def batches(self, batch_size, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for offset in range(start, stop, batch_size):
+            end = min(offset + batch_size, stop)
+            yield self.dense[offset:end], self.payload.slice(offset, end - offset)
+
+    # Yields rows in the same shape as the streamed dataset, the dense vector being a memmap view of the row
+    def rows(self, start=0, stop=None, batch_size=1000):
+        for dense, payload in self.batches(batch_size, start, stop):
+            for vector, item in zip(dense, payload.to_pylist()):
+                item[DENSE_FIELD] = vector
+                yield item
+
+# A batch of the cache in columns: a memmap slice of the dense matrix and a slice of the Arrow table,
+# neither of them copies data. Only the payload columns that are used get converted to Python values.
+class ColumnBatch:
+    def __init__(self, dense, payload):
+        self.dense = dense
+        self.payload = payload
+
+    def __len__(self):
+        return len(self.dense)
+
+    def column(self, name):
+        return self.payload.column(name).to_pylist()
+
+    @property
+    def column_names(self):
+        return self.payload.column_names
+
+    @property
+    def nbytes(self):
+        return self.dense.nbytes + self.payload.nbytes
+
+# Rows [start, stop) of the cache, read by the ingestion as column batches instead of rows.
+# batch_size is called before every batch is cut, so an adaptive batch size keeps working.
+# Iterating over it yields the rows like DbpediaCache.rows.
+class CacheRange:
+    def __init__(self, cache, start=0, stop=None):
+        self.cache = cache
+        self.start = start
+        self.stop = len(cache) if stop is None else min(stop, len(cache))
+
+    def __iter__(self):
+        return self.cache.rows(self.start, self.stop)
+
+    def batches(self, batch_size):
+        offset = self.start
+        while offset < self.stop:
+            end = min(offset + batch_size(), self.stop)
+            yield ColumnBatch(self.cache.dense[offset:end], self.cache.payload.slice(offset, end - offset))
+            offset = end
+
+# One-time conversion of the streamed dataset into the local cache
+def convert(path, limit, batch_size):
+    os.makedirs(path, exist_ok=True)
+    dataset = load_dataset(DATASET_NAME, split="train", streaming=True).take(limit)
+
+    # The stream has no length, so the matrix is allocated for limit rows and meta.json records how many were written
+    dense = np.lib.format.open_memmap(os.path.join(path, "dense.npy"), mode="w+", dtype=np.float32, shape=(limit, DENSE_SIZE))
+    writer = None
+    rows = 0
+    with tqdm(total=limit, desc="Converting rows") as pbar:
+        for batch in dataset.iter(batch_size=batch_size):
+            vectors = np.asarray(batch.pop(DENSE_FIELD), dtype=np.float32)
+            dense[rows:rows + len(vectors)] = vectors
+            table = pa.table(batch)
+            if writer is None:
+                writer = pq.ParquetWriter(os.path.join(path, "payload.parquet"), table.schema)
+            writer.write_table(table)
+            rows += len(vectors)
+            pbar.update(len(vectors))
+
+    dense.flush()
+    if writer is not None:
+        writer.close()
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"dataset": DATASET_NAME, "rows": rows, "dimensions": DENSE_SIZE}, f)
+    print(f"Cached {rows} rows in {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the dbpedia dataset into a local memory mapped cache")
+    parser.add_argument("--path", default=os.path.join(".cache", "dbpedia"), help="Cache directory (default: .cache/dbpedia)")
+    parser.add_argument("--limit", type=int, default=DATASET_ROWS, help=f"Number of rows to convert (default: {DATASET_ROWS})")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per conversion step (default: 10000)")
+    args = parser.parse_args()
+    convert(args.path, args.limit, args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -1,149 +1,584 @@
-from qdrant_client import QdrantClient, models
+from qdrant_client import AsyncQdrantClient, models
 from datasets import load_dataset
 from fastembed import SparseTextEmbedding
+from dbpedia_cache import DbpediaCache, CacheRange, ColumnBatch, DATASET_NAME, DATASET_ROWS, DENSE_FIELD
+from batch_upload import columns_to_points, select_rows
+from client_pool import ClientPool
+from adaptive import AimdController
+from sparse_cache import SparseCache
+from embedding_models import SPARSE_MODEL_NAME
+from checkpoint import Checkpoint
+from payload_projection import PAYLOAD_FIELDS, TextStore, project, create_payload_indexes
+from sparse_pruning import prune_csr, pruning_from_env, describe
+from memory_budget import ByteBudget, MemorySampler, batch_bytes
+from storage_profiles import PROFILES, dense_vector_params, quantization_config, encode_dense, collection_profile
+from bulk_load import suspend_indexing, original_indexing_threshold, finish_load
+import ingest_metrics as metrics
+import numpy as np
 import os
 import time
-from itertools import islice
 import uuid
+import argparse
+import asyncio
+from itertools import islice
+import queue
+import threading
+import multiprocessing
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
-from more_itertools import chunked
 import random
 
 # Force reloading the environment variables
 load_dotenv(override=True)
 
-dataset = load_dataset(
-    "Qdrant/dbpedia-entities-openai3-text-embedding-3-large-1536-1M",
-    split="train",
-    streaming=True
-).take(1000000)
-
-client = QdrantClient(os.getenv("QDRANT_HOST"), prefer_grpc=True)
-
-collection_name, shard_number, replication_factor = os.getenv("COLLECTION_NAME"), os.getenv("SHARD_NUMBER"), os.getenv("REPLICATION_FACTOR")
-client.delete_collection(collection_name="dbpedia_entities_openai3")
-
 # We create a collection with the following parameters:
 # - dense vector size: 1536
-# - distance: cosine
 # - on_disk: True (we store the dense vector on disk)
-# - quantization: BinaryQuantization (we store the BQ vector in RAM)
+# - datatype, distance and quantization of the dense vector depend on the storage profile, see storage_profiles.py:
+#   float32 (the default) and float16 use cosine with BinaryQuantization (we store the BQ vector in RAM),
+#   uint8 uses Euclid without quantization
 # - sparse vectors: will be based on the Splade model
+# - on_disk_payload: keep the payloads on disk instead of in RAM (the payload indexes stay in RAM)
 # - hnsw_config: HnswConfigDiff (we disable HNSW graph construction, which will allow for faster uploads, and we'll turn it on later)
 # - Shard number: 3 (we split the collection into 3 shards, with 3 nodes this typically results in 1 shard per node)
 # - replication_factor: 1 (we want to replicate the collection on 1 node)
-client.create_collection(
-    collection_name=collection_name,
-    vectors_config={
-        "dense": models.VectorParams(
-            size=1536,
-            distance=models.Distance.COSINE,
-            on_disk=True # We store the dense vector on disk
+# With shard_keys the collection uses custom sharding: every node gets its own shard key with shard_number shards,
+# so the client pool can send points straight to the node holding them.
+# The payload indexes are created right away, with payload_indexes=False they are left for after the load (see payload_projection.py).
+# The storage profile and the run_id (if any) are stored in the collection metadata, so searches know how to encode
+# their queries and the other ingest workers know the collection is theirs.
+def create_collection(client, collection_name, shard_number, replication_factor, shard_keys=False, run_id=None, profile="float32", on_disk_payload=False, payload_indexes=True):
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={
+            "dense": dense_vector_params(profile),
+        },
+        sparse_vectors_config={
+            "sparse": models.SparseVectorParams()
+        },
+        quantization_config=quantization_config(profile),
+        hnsw_config=models.HnswConfigDiff(
+            m=0, # We disable HNSW graph construction, which will allow for faster uploads, and we'll turn it on later
         ),
-    },
-    sparse_vectors_config={
-        "sparse": models.SparseVectorParams()
-    },
-    quantization_config=models.BinaryQuantization(
-            binary=models.BinaryQuantizationConfig(always_ram=True), # We store the BQ vector in RAM
-    ),
-    hnsw_config=models.HnswConfigDiff(
-        m=0, # We disable HNSW graph construction, which will allow for faster uploads, and we'll turn it on later
-    ),
-    shard_number=int(shard_number),
-    replication_factor=int(replication_factor)
-)
-
-# Add indexing for the user_id field
-client.create_payload_index(
-    collection_name=collection_name,
-    field_name="user_id",
-    field_schema="integer"
-)
-
-# Sparse embedding model
-sparse_model = SparseTextEmbedding(
-    model_name="prithivida/Splade_PP_en_v1",
-    threads=8
-)
-
-# Upsert batch of points
-def process_and_upload(batch):
-    points = []
-    for item in batch:
-        sparse_embedding = list(sparse_model.embed(item["text"]))[0]
-        points.append(
-            models.PointStruct(
-                id=str(uuid.uuid4()),
-                vector={
-                    "dense": item["text-embedding-3-large-1536-embedding"],
-                    "sparse": {"indices": sparse_embedding.indices, "values": sparse_embedding.values}
-                },
-                payload={**{k: v for k, v in item.items() if k != "text-embedding-3-large-1536-embedding"}, "user_id": random.randint(1, 10)}
+        shard_number=shard_number,
+        replication_factor=replication_factor,
+        sharding_method=models.ShardingMethod.CUSTOM if shard_keys else None,
+        on_disk_payload=on_disk_payload,
+        metadata={"storage_profile": profile, **({"run_id": run_id} if run_id else {})}
+    )
+    if shard_keys:
+        client.create_shard_keys(collection_name, shard_number, replication_factor)
+
+    # Add indexing for the user_id field
+    if payload_indexes:
+        create_payload_indexes(client, collection_name)
+
+# Storage profile of the dense vectors, main() reads it from the collection
+dense_profile = "float32"
+
+# Payload projection, main() sets it up: the payload fields to upsert (None keeps all of them)
+# and the external store the text goes to instead of the payload (None keeps it in the payload)
+payload_fields = None
+text_store = None
+
+# Sparse embedding model, optional sparse cache and optional pruning settings, every embedding process loads its own instance
+sparse_model = None
+sparse_cache = None
+sparse_pruning = None
+
+def init_sparse_model(threads, cache_path=None, pruning=None):
+    global sparse_model, sparse_cache, sparse_pruning
+    sparse_model = SparseTextEmbedding(
+        model_name=SPARSE_MODEL_NAME,
+        threads=threads
+    )
+    if cache_path:
+        sparse_cache = SparseCache(cache_path, SPARSE_MODEL_NAME)
+    sparse_pruning = pruning
+
+# Runs inside the embedding processes, fastembed splits the texts into inference batches of embed_batch_size.
+# With a sparse cache, only the texts missing from the cache go through the model and are added to the cache afterwards.
+# The cache holds the full vectors, pruning (see sparse_pruning.py) is applied after it, so changing it needs no new cache.
+# The embeddings are returned as CSR arrays (indptr, indices, values), three arrays are much cheaper
+# to send back to the main process than one object per text. The seconds spent and the number of cache hits
+# are returned as well, metrics can only be recorded in the main process.
+def embed_texts(texts, embed_batch_size):
+    started = time.perf_counter()
+    embeddings = sparse_cache.get_many(texts) if sparse_cache else [None] * len(texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        computed = [
+            (embedding.indices, embedding.values)
+            for embedding in sparse_model.embed([texts[i] for i in missing], batch_size=embed_batch_size)
+        ]
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding
+        if sparse_cache:
+            sparse_cache.put_many([texts[i] for i in missing], computed)
+
+    indptr = np.zeros(len(embeddings) + 1, dtype=np.int64)
+    np.cumsum([len(indices) for indices, _ in embeddings], out=indptr[1:])
+    indices = np.concatenate([indices for indices, _ in embeddings]).astype(np.uint32)
+    values = np.concatenate([values for _, values in embeddings]).astype(np.float32)
+    sparse = prune_csr(indptr, indices, values, **sparse_pruning) if sparse_pruning else (indptr, indices, values)
+    return sparse, time.perf_counter() - started, len(texts) - len(missing)
+
+# Derive the point id from the dataset _id, so ingesting the same row twice overwrites the point instead of duplicating it
+def point_id(dataset_id):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, dataset_id))
+
+# The user_id is random but seeded by the dataset _id, so it stays the same across runs as well
+def user_id(dataset_id):
+    return random.Random(dataset_id).randint(1, 10)
+
+# The texts of a batch, the input of the sparse model
+def batch_texts(batch):
+    return batch.column("text") if isinstance(batch, ColumnBatch) else [item["text"] for item in batch]
+
+# Columns of a batch of dataset rows and their sparse embeddings: (ids, dense, sparse, payload), see batch_upload.py
+# A column batch of the local cache passes its memmap slice on as the dense matrix and its payload columns
+# are read from the Arrow table, rows from the stream are turned into columns first.
+# The payload only holds the projected fields, the text is written to the text store first when there is one.
+def batch_columns(batch, sparse_embeddings):
+    if isinstance(batch, ColumnBatch):
+        dense = batch.dense
+        payload = {key: batch.column(key) for key in batch.column_names}
+    else:
+        dense = [item[DENSE_FIELD] for item in batch]
+        payload = {key: [item[key] for item in batch] for key in batch[0] if key != DENSE_FIELD}
+    ids = [point_id(dataset_id) for dataset_id in payload["_id"]]
+    payload["user_id"] = [user_id(dataset_id) for dataset_id in payload["_id"]]
+    if text_store:
+        text_store.put_many(ids, payload["text"])
+    return (
+        ids,
+        encode_dense(dense_profile, dense),
+        sparse_embeddings,
+        project(payload, payload_fields, text_store)
+    )
+
+# Split the columns of a batch up per shard key of the client pool, yields (shard key, columns)
+def split_by_shard_key(pool, columns):
+    shard_keys = np.array([pool.shard_key_for(i) for i in columns[0]])
+    for shard_key in np.unique(shard_keys):
+        yield str(shard_key), select_rows(np.flatnonzero(shard_keys == shard_key), *columns)
+
+# The upserts of a batch as (shard key, points) pairs. The shard key is None, unless the client pool
+# uses shard keys, then there is a part of the batch for every node.
+def batch_upserts(client, batch, sparse_embeddings):
+    columns = batch_columns(batch, sparse_embeddings)
+    if not (isinstance(client, ClientPool) and client.shard_keys):
+        return [(None, columns_to_points(client, *columns))]
+    return [
+        (shard_key, columns_to_points(client, *shard_columns))
+        for shard_key, shard_columns in split_by_shard_key(client, columns)
+    ]
+
+# Upsert a batch, every part of the batch goes to the node holding its shard key.
+# With wait=False Qdrant acknowledges the upserts before applying them, see bulk_load.py
+def upload_batch(client, collection_name, batch, sparse_embeddings, wait=True):
+    with metrics.SERIALIZE_SECONDS.time():
+        upserts = batch_upserts(client, batch, sparse_embeddings)
+    with metrics.UPSERT_SECONDS.time():
+        for shard_key, points in upserts:
+            if shard_key is None:
+                client.upsert(collection_name=collection_name, points=points, wait=wait)
+            else:
+                client.call_shard(
+                    shard_key,
+                    lambda node, key: node.upsert(collection_name=collection_name, points=points, shard_key_selector=key, wait=wait)
+                )
+
+# Async variant of upload_batch, with one AsyncQdrantClient per node of the client pool.
+# Without shard keys the batch goes to the node picked by the caller, with shard keys the parts are upserted concurrently.
+# Like the sync pool, an unavailable node is skipped for a while and the upsert fails over to the next node.
+async def async_upload_batch(pool, async_clients, node, collection_name, batch, sparse_embeddings, wait=True):
+    with metrics.SERIALIZE_SECONDS.time():
+        upserts = batch_upserts(pool, batch, sparse_embeddings)
+    with metrics.UPSERT_SECONDS.time():
+        await asyncio.gather(*(
+            pool.call_async(
+                async_clients,
+                lambda client, shard_key=shard_key, points=points: client.upsert(
+                    collection_name=collection_name,
+                    points=points,
+                    shard_key_selector=shard_key,
+                    wait=wait
+                ),
+                prefer=node if shard_key is None else pool.shard_keys[shard_key]
             )
-        )
-    client.upsert(
-        collection_name=collection_name,
-        points=points
+            for shard_key, points in upserts
+        ))
+
+# Balanced, deterministic split of rows [0, total) over the workers, returns the [start, stop) range of a worker
+def partition_range(total, num_workers, worker_index):
+    return total * worker_index // num_workers, total * (worker_index + 1) // num_workers
+
+# The dataset slice of a worker, starting at offset within the slice. Returns (rows, slice length or None if unknown):
+# - from the local cache: an ID range of the cache, cut into column batches straight from the memory map
+# - from the stream: the HF shards (parquet files) are divided over the workers when there are enough of them,
+#   otherwise the stream is split in ID ranges, which means every worker reads (and drops) the rows before its range
+def worker_dataset(cache_path, num_workers, worker_index, offset):
+    if cache_path:
+        cache = DbpediaCache(cache_path)
+        start, stop = partition_range(len(cache), num_workers, worker_index)
+        return CacheRange(cache, start + offset, stop), stop - start
+
+    dataset = load_dataset(DATASET_NAME, split="train", streaming=True)
+    if num_workers > 1 and dataset.n_shards >= num_workers:
+        return dataset.shard(num_shards=num_workers, index=worker_index).skip(offset), None
+    start, stop = partition_range(DATASET_ROWS, num_workers, worker_index)
+    return dataset.skip(start + offset).take(stop - start - offset), stop - start
+
+# Workers other than the first one do not create the collection, they wait until the first worker did.
+# With a run_id the collection also has to carry it, otherwise a collection left over from an earlier run
+# could be written to right before the first worker recreates it.
+def wait_for_collection(client, collection_name, run_id=None, interval=5.0):
+    while True:
+        if client.collection_exists(collection_name):
+            metadata = client.get_collection(collection_name).config.metadata or {}
+            if run_id is None or metadata.get("run_id") == run_id:
+                return
+        print(f"Waiting for worker 0 to create {collection_name}" + (f" for run {run_id}" if run_id else ""))
+        time.sleep(interval)
+
+# Spawn instead of fork, forking a process with an open gRPC channel is not safe.
+# The initializer loads the sparse model in every process, benchmarks can swap in a stand-in model.
+def create_embed_pool(embed_workers, embed_threads, sparse_cache_path=None, initializer=init_sparse_model, pruning=None):
+    return ProcessPoolExecutor(
+        max_workers=embed_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=(embed_threads, sparse_cache_path, pruning)
     )
 
-# Process and upload points in parallel
-batch_size, max_workers = int(os.getenv("BATCH_SIZE")), int(os.getenv("MAX_WORKERS"))
-print(f"Batch size: {batch_size}, Max workers: {max_workers}")
-
-def stream_and_ingest(dataset, batch_size, max_workers):
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Create an iterator of batches from the streaming dataset
-        batch_iter = chunked(dataset, batch_size)
-
-        futures = []
-        with tqdm(desc="Inserting batches") as pbar:
-            for batch in batch_iter:
-                # Submit each batch one-by-one
-                futures.append(executor.submit(process_and_upload, batch))
-
-                # Control memory usage by throttling futures
-                if len(futures) >= max_workers * 2:
-                    done, not_done = wait_some(futures)
-                    for f in done:
-                        f.result()
-                        pbar.update(1)
-                    futures = not_done
-
-            # Final remaining
-            for f in as_completed(futures):
-                f.result()
-                pbar.update(1)
-
-def wait_some(futures):
-    from concurrent.futures import wait, FIRST_COMPLETED
-    done, not_done = wait(futures, return_when=FIRST_COMPLETED)
-    return list(done), list(not_done)
-
-print(f"Starting to upload points to {collection_name} with shard number {shard_number} and replication factor {replication_factor}")
-stream_and_ingest(dataset, batch_size, max_workers)
-
-# Enable HNSW graph construction
-client.update_collection(
-    collection_name="dbpedia_entities_openai3",
-    hnsw_config=models.HnswConfigDiff(
-        m=16, # We enable HNSW graph construction
+# Yield batches from iterable, the size of every batch is read from the controller when the batch is cut.
+# A range of the local cache yields column batches, any other dataset yields lists of rows.
+def batched(iterable, controller):
+    if isinstance(iterable, CacheRange):
+        yield from iterable.batches(lambda: controller.batch_size)
+        return
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, controller.batch_size)):
+        yield batch
+
+# Staged pipeline:
+# 1. The main thread reads the dataset and cuts it into batches
+# 2. A process pool computes the sparse embeddings (CPU-bound, every process has its own model and ONNX threads)
+# 3. A thread pool upserts the batches (I/O-bound, mostly waiting on gRPC)
+# Stage 1 hands (batch, embedding future) pairs to stage 3 through a bounded queue, so reading and
+# embedding block as soon as the uploads fall behind and memory usage stays flat.
+# The controller decides on the batch size and on how many of the upload threads may upsert at the same time,
+# a failed upsert is retried upload_retries times before the ingestion gives up.
+# With wait=False a batch counts as acknowledged once Qdrant has it in its WAL, not once it is applied.
+# With a byte budget the reader also blocks while the estimated bytes of the batches in flight (read, embedding,
+# queued or upserting) would exceed it, see memory_budget.py. A memory sampler is shown next to the progress.
+def stream_and_ingest(client, collection_name, dataset, checkpoint, controller, embed_pool, embed_batch_size, queue_size, upload_retries, wait=True, budget=None, memory=None):
+    upload_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    # Blocks while the byte budget is used up, gives up once an upload worker failed
+    def reserve(size):
+        while not stop.is_set():
+            if budget is None or budget.acquire(size, timeout=1):
+                return True
+        return False
+
+    # Blocks while the queue is full, gives up once an upload worker failed
+    def enqueue(job):
+        while not stop.is_set():
+            try:
+                upload_queue.put(job, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def upload_worker(pbar):
+        while not stop.is_set():
+            try:
+                job = upload_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if job is None:
+                return
+            batch_index, batch, embed_future, size = job
+            try:
+                sparse_embeddings, embed_seconds, cache_hits = embed_future.result()
+                metrics.record_embed(embed_seconds, len(batch), cache_hits)
+                for attempt in range(upload_retries + 1):
+                    started = controller.acquire()
+                    try:
+                        upload_batch(client, collection_name, batch, sparse_embeddings, wait)
+                    except Exception as e:
+                        controller.release(started, error=e)
+                        metrics.record_error(e)
+                        if attempt == upload_retries:
+                            raise
+                        metrics.RETRIES.inc()
+                        time.sleep(min(2 ** attempt, 30))
+                    else:
+                        controller.release(started)
+                        break
+            except Exception:
+                # Unblock the reader and the other upload workers
+                stop.set()
+                raise
+            finally:
+                if budget:
+                    budget.release(size)
+            checkpoint.ack(batch_index, len(batch))
+            metrics.POINTS.inc(len(batch))
+            metrics.BATCHES.inc()
+            if memory:
+                pbar.set_postfix_str(memory.summary(), refresh=False)
+            pbar.update(1)
+
+    metrics.track(controller, upload_queue.qsize)
+    metrics.track_memory(budget, memory)
+    with embed_pool, ThreadPoolExecutor(max_workers=controller.max_concurrency) as upload_pool, tqdm(desc="Inserting batches") as pbar:
+        uploaders = [upload_pool.submit(upload_worker, pbar) for _ in range(controller.max_concurrency)]
+
+        for batch_index, batch in enumerate(metrics.timed(batched(dataset, controller), metrics.READ_SECONDS)):
+            size = batch_bytes(batch) if budget else 0
+            if not reserve(size):
+                embed_pool.shutdown(cancel_futures=True)
+                break
+            embed_future = embed_pool.submit(embed_texts, batch_texts(batch), embed_batch_size)
+            if not enqueue((batch_index, batch, embed_future, size)):
+                embed_pool.shutdown(cancel_futures=True)
+                break
+
+        # Tell every upload worker there is no more work
+        for _ in uploaders:
+            enqueue(None)
+
+        # Raise the first upload error, if any
+        for f in uploaders:
+            f.result()
+
+# Async variant of stream_and_ingest, with the same stages, checkpoints and retries:
+# - the dataset is read in a thread, so a slow stream does not block the event loop
+# - embeddings are computed in the same process pool, awaited through run_in_executor
+# - upserts are coroutines on AsyncQdrantClient (one per node, round robin), thousands of them cost
+#   far less than the same amount of threads
+# A semaphore bounds the batches in flight (embedding, waiting or upserting) to queue_size plus the maximum
+# concurrency. The upserts themselves wait on a condition that works like a semaphore whose size is
+# controller.concurrency, so --adaptive keeps working in this mode. The byte budget is waited for in a thread as well.
+async def async_stream_and_ingest(pool, collection_name, dataset, checkpoint, controller, embed_pool, embed_batch_size, queue_size, upload_retries, wait=True, budget=None, memory=None):
+    loop = asyncio.get_running_loop()
+    async_clients = [AsyncQdrantClient(**client.init_options) for client in pool.clients]
+    batches = metrics.timed(batched(dataset, controller), metrics.READ_SECONDS)
+    in_flight = asyncio.Semaphore(queue_size + controller.max_concurrency)
+    upsert_slot = asyncio.Condition()
+    tasks = set()
+    errors = []
+
+    async def upsert(node, batch, sparse_embeddings):
+        for attempt in range(upload_retries + 1):
+            # Only the event loop thread uses the controller, so it is free once the condition holds
+            async with upsert_slot:
+                await upsert_slot.wait_for(lambda: controller.in_flight < controller.concurrency)
+                started = controller.acquire()
+            error = None
+            try:
+                await async_upload_batch(pool, async_clients, node, collection_name, batch, sparse_embeddings, wait)
+            except Exception as e:
+                error = e
+            controller.release(started, error=error)
+            async with upsert_slot:
+                upsert_slot.notify_all()
+            if error is None:
+                return
+            metrics.record_error(error)
+            if attempt == upload_retries:
+                raise error
+            metrics.RETRIES.inc()
+            await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def ingest_batch(batch_index, batch, size, pbar):
+        try:
+            sparse_embeddings, embed_seconds, cache_hits = await loop.run_in_executor(embed_pool, embed_texts, batch_texts(batch), embed_batch_size)
+            metrics.record_embed(embed_seconds, len(batch), cache_hits)
+            await upsert(batch_index % len(async_clients), batch, sparse_embeddings)
+            checkpoint.ack(batch_index, len(batch))
+            metrics.POINTS.inc(len(batch))
+            metrics.BATCHES.inc()
+            if memory:
+                pbar.set_postfix_str(memory.summary(), refresh=False)
+            pbar.update(1)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if budget:
+                budget.release(size)
+            in_flight.release()
+
+    # Batches that are being embedded, waiting for an upsert slot or being upserted
+    metrics.track(controller, lambda: len(tasks))
+    metrics.track_memory(budget, memory)
+    with embed_pool, tqdm(desc="Inserting batches") as pbar:
+        batch_index = 0
+        while True:
+            await in_flight.acquire()
+            batch = None if errors else await loop.run_in_executor(None, next, batches, None)
+            if batch is None:
+                break
+            size = batch_bytes(batch) if budget else 0
+            if budget:
+                await loop.run_in_executor(None, budget.acquire, size)
+            task = asyncio.create_task(ingest_batch(batch_index, batch, size, pbar))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            batch_index += 1
+
+        # Stop the other batches after a failure, otherwise wait for all of them
+        if errors:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for client in async_clients:
+            await client.close()
+
+    # Raise the first upload error, if any
+    if errors:
+        raise errors[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the dbpedia 1M dataset into Qdrant")
+    parser.add_argument("--resume", action="store_true", help="Continue after the last checkpoint instead of recreating the collection")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: .checkpoints/<collection name>.json, or <collection name>.<i>-of-<n>.json with --num-workers)")
+    parser.add_argument("--cache", help="Read the dataset from a local cache created by dbpedia_cache.py instead of streaming it")
+    parser.add_argument("--adaptive", action="store_true", help="Let an AIMD controller adjust the batch size and upload concurrency during the ingestion")
+    parser.add_argument("--shard-keys", action="store_true", help="Use custom sharding with one shard key per node and send points straight to their node")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads", help="Upsert from a thread pool or from asyncio coroutines (default: threads)")
+    parser.add_argument("--sparse-cache", default=os.getenv("SPARSE_CACHE"), help="SQLite file caching sparse embeddings across runs (default: SPARSE_CACHE, no cache when unset)")
+    parser.add_argument("--bulk-load", action="store_true", help="Upsert without waiting and suspend indexing until all points are in, see bulk_load.py")
+    parser.add_argument("--metrics-port", type=int, default=os.getenv("METRICS_PORT"), help="Expose Prometheus metrics of the ingestion on this port, plus the worker index (default: METRICS_PORT)")
+    parser.add_argument("--storage-profile", choices=list(PROFILES), default=os.getenv("STORAGE_PROFILE", "float32"), help="Datatype of the stored dense vectors, see storage_profiles.py (default: STORAGE_PROFILE or float32)")
+    parser.add_argument("--snapshot", action="store_true", help="Store shard snapshots of the collection in .snapshots/<collection name> once it is indexed, see dbpedia_snapshot.py")
+    parser.add_argument("--tracemalloc", action="store_true", help="Trace the Python heap next to the RSS, slows the ingestion down")
+    parser.add_argument("--payload-fields", default=os.getenv("PAYLOAD_FIELDS"), help=f"Comma separated payload fields to upsert, out of {','.join(PAYLOAD_FIELDS)} (default: PAYLOAD_FIELDS, all of them when unset)")
+    parser.add_argument("--text-store", default=os.getenv("TEXT_STORE"), help="SQLite file the text goes to instead of the payload (default: TEXT_STORE, text stays in the payload when unset)")
+    parser.add_argument("--on-disk-payload", action="store_true", help="Create the collection with the payloads on disk instead of in RAM")
+    parser.add_argument("--defer-payload-index", action="store_true", help="Create the payload indexes after the load instead of before it")
+    parser.add_argument("--num-workers", type=int, default=1, help="Split the dataset over this many ingest processes or hosts (default: 1)")
+    parser.add_argument("--worker-index", type=int, default=0, help="Slice of the dataset this process ingests, from 0 to --num-workers - 1 (default: 0)")
+    parser.add_argument("--run-id", default=os.getenv("RUN_ID"), help="Id shared by all workers of a run, the other workers only write to a collection worker 0 created for it (default: RUN_ID)")
+    args = parser.parse_args()
+    if not 0 <= args.worker_index < args.num_workers:
+        parser.error("--worker-index must be between 0 and --num-workers - 1")
+    if args.snapshot and args.num_workers > 1:
+        parser.error("--snapshot is taken once all workers are done, pass it to ingest_coordinator.py instead")
+    if args.payload_fields and not set(args.payload_fields.split(",")) <= set(PAYLOAD_FIELDS):
+        parser.error(f"--payload-fields must be out of {','.join(PAYLOAD_FIELDS)}")
+
+    # Every worker on the same host needs its own port
+    if args.metrics_port:
+        port = int(args.metrics_port) + args.worker_index
+        metrics.serve(port)
+        print(f"Serving ingestion metrics on http://localhost:{port}/metrics")
+
+    # One client per node in QDRANT_HOSTS, see client_pool.py
+    client = ClientPool.from_env(log=tqdm.write)
+
+    collection_name, shard_number, replication_factor = os.getenv("COLLECTION_NAME"), int(os.getenv("SHARD_NUMBER")), int(os.getenv("REPLICATION_FACTOR"))
+    checkpoint_path = args.checkpoint or Checkpoint.default_path(collection_name, args.worker_index, args.num_workers)
+    worker = {"worker_index": args.worker_index, "num_workers": args.num_workers}
+    # Worker 0 (re)creates the collection and owns its settings, the other workers only add points
+    lead = args.worker_index == 0
+
+    if args.resume and client.collection_exists(collection_name):
+        checkpoint = Checkpoint.load(checkpoint_path, **worker)
+        print(f"Resuming {collection_name} at offset {checkpoint.offset}")
+    elif lead:
+        client.delete_collection(collection_name=collection_name)
+        create_collection(
+            client, collection_name, shard_number, replication_factor, args.shard_keys, args.run_id, args.storage_profile,
+            on_disk_payload=args.on_disk_payload, payload_indexes=not args.defer_payload_index
+        )
+        checkpoint = Checkpoint(checkpoint_path, **worker)
+    else:
+        wait_for_collection(client, collection_name, args.run_id)
+        checkpoint = Checkpoint(checkpoint_path, **worker)
+    if args.shard_keys and not client.shard_keys:
+        client.use_shard_keys()
+
+    # A resumed collection or one created by worker 0 keeps the profile it was created with
+    global dense_profile, payload_fields, text_store
+    dense_profile = collection_profile(client, collection_name)
+    payload_fields = args.payload_fields.split(",") if args.payload_fields else None
+    text_store = TextStore(args.text_store) if args.text_store else None
+
+    # Suspend indexing for the load, the threshold to restore afterwards is kept in the collection metadata
+    if args.bulk_load and lead:
+        suspend_indexing(client, collection_name)
+
+    dataset, checkpoint.rows = worker_dataset(args.cache, args.num_workers, args.worker_index, checkpoint.offset)
+    checkpoint.save()
+    if args.num_workers > 1:
+        print(f"Worker {args.worker_index} of {args.num_workers}: {checkpoint.rows or 'unknown'} rows, starting at offset {checkpoint.offset}")
+
+    # Concurrency per stage:
+    # - EMBED_WORKERS processes each run the sparse model with EMBED_THREADS ONNX threads
+    # - UPLOAD_WORKERS threads upsert in parallel (falls back to the former MAX_WORKERS setting)
+    # - QUEUE_SIZE embedded batches may wait for an upload worker
+    # With --adaptive, BATCH_SIZE and UPLOAD_WORKERS are the starting point for the controller, which keeps
+    # the batch size between MIN_BATCH_SIZE and MAX_BATCH_SIZE, the concurrency below MAX_UPLOAD_WORKERS,
+    # and aims for an upsert latency of TARGET_LATENCY seconds
+    batch_size = int(os.getenv("BATCH_SIZE"))
+    embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", 64))
+    embed_workers = int(os.getenv("EMBED_WORKERS", 2))
+    embed_threads = int(os.getenv("EMBED_THREADS", max(1, os.cpu_count() // embed_workers)))
+    upload_workers = int(os.getenv("UPLOAD_WORKERS", os.getenv("MAX_WORKERS", 6)))
+    upload_retries = int(os.getenv("UPLOAD_RETRIES", 3))
+    if args.adaptive:
+        controller = AimdController(
+            batch_size,
+            upload_workers,
+            min_batch_size=int(os.getenv("MIN_BATCH_SIZE", 16)),
+            max_batch_size=int(os.getenv("MAX_BATCH_SIZE", 1000)),
+            max_concurrency=int(os.getenv("MAX_UPLOAD_WORKERS", upload_workers * 4)),
+            target_latency=float(os.getenv("TARGET_LATENCY", 2.0)),
+            log=tqdm.write
+        )
+    else:
+        controller = AimdController.fixed(batch_size, upload_workers, log=tqdm.write)
+    queue_size = int(os.getenv("QUEUE_SIZE", controller.max_concurrency * 2))
+    # SPARSE_TOP_K, SPARSE_THRESHOLD and SPARSE_MASS prune the sparse vectors before they are upserted
+    pruning = pruning_from_env()
+    # MAX_INFLIGHT_MB bounds the estimated bytes of the batches in flight, next to QUEUE_SIZE
+    max_inflight_mb = os.getenv("MAX_INFLIGHT_MB")
+    budget = ByteBudget(int(float(max_inflight_mb) * 2**20)) if max_inflight_mb else None
+    print(f"Batch size: {batch_size}, Embed batch size: {embed_batch_size}, Embed workers: {embed_workers} x {embed_threads} threads, Upload workers: {upload_workers}, Queue size: {queue_size}, Adaptive: {args.adaptive}, Mode: {args.mode}, Sparse cache: {args.sparse_cache}, Bulk load: {args.bulk_load}, Storage profile: {dense_profile}, Payload fields: {args.payload_fields or 'all'}, Text store: {args.text_store}, Sparse pruning: {describe(pruning)}, Max in flight: {max_inflight_mb or 'unbounded'} MB")
+
+    print(f"Starting to upload points to {collection_name} on {len(client.clients)} node(s) with shard number {shard_number}, replication factor {replication_factor} and shard keys: {args.shard_keys}")
+    embed_pool = create_embed_pool(embed_workers, embed_threads, args.sparse_cache, pruning=pruning)
+    started = time.perf_counter()
+    with MemorySampler(trace=args.tracemalloc) as memory:
+        if args.mode == "async":
+            asyncio.run(async_stream_and_ingest(client, collection_name, dataset, checkpoint, controller, embed_pool, embed_batch_size, queue_size, upload_retries, wait=not args.bulk_load, budget=budget, memory=memory))
+        else:
+            stream_and_ingest(client, collection_name, dataset, checkpoint, controller, embed_pool, embed_batch_size, queue_size, upload_retries, wait=not args.bulk_load, budget=budget, memory=memory)
+    checkpoint.finish()
+    if text_store:
+        text_store.close()
+    points, seconds = checkpoint.offset - checkpoint.run_offset, time.perf_counter() - started
+    print(
+        f"Ingested {points} points in {seconds:.0f}s ({points / seconds:.0f} points/s), {memory.summary()}"
+        + (f", peak in flight {budget.peak / 2**20:.0f} MiB" if budget else "")
     )
-)
-
-# Check the number of vectors in the collection
-collection_info = client.get_collection("dbpedia_entities_openai3")
-print(f"Number of vectors in collection: {collection_info.points_count}")
-
-# Wait for indexing to complete
-while True:
-    status = client.get_collection("dbpedia_entities_openai3").status
-    print(f"Indexing status: {status}")
-    if status == "green":
-        print("Indexing complete.")
-        break
-    time.sleep(5)
-
-client
\ No newline at end of file
+
+    # With several workers, indexing starts once all of them are done, ingest_coordinator.py takes care of that
+    if args.num_workers > 1:
+        print(f"Worker {args.worker_index} of {args.num_workers} done at offset {checkpoint.offset}")
+        client.close()
+        return
+
+    # Payload indexes, HNSW and indexing, waiting for the index, the data version and the snapshot, see bulk_load.py
+    finish_load(client, collection_name, original_indexing_threshold(client, collection_name) if args.bulk_load else None, args.snapshot)
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+from qdrant_client import models
+from client_pool import ClientPool
+from bulk_load import wait_for_index
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import requests
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+CHUNK_SIZE = 1 << 20
+
+# Snapshots of the ingested collection, so a benchmark cycle restores 1M points in minutes instead of ingesting them again.
+# create:
+# - one snapshot per shard, taken on a node holding an active replica of it and downloaded to the snapshot directory
+# - manifest.json with the collection config, the payload schema and the point count of every shard
+# restore:
+# - the collection is created again from the manifest (on the cluster, or on a single local Qdrant binary with --hosts)
+# - every shard snapshot is uploaded to every node holding a replica of that shard
+# - the point counts (per shard and in total), the indexed vectors and the payload indexes are compared with the manifest
+def snapshot_dir(collection_name):
+    return os.path.join(".snapshots", collection_name)
+
+# Shard id -> (shard key, [(node index, points count)]) of the active local replicas on every node
+def shard_replicas(pool, collection_name):
+    replicas = {}
+    for i, node in enumerate(pool.clients):
+        for shard in node.collection_cluster_info(collection_name).local_shards:
+            if shard.state == models.ReplicaState.ACTIVE:
+                replicas.setdefault(shard.shard_id, (shard.shard_key, []))[1].append((i, shard.points_count))
+    return replicas
+
+def download(url, path, checksum=None):
+    sha256 = hashlib.sha256()
+    with requests.get(url, stream=True) as response, open(path + ".tmp", "wb") as f:
+        response.raise_for_status()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            sha256.update(chunk)
+            f.write(chunk)
+    if checksum and sha256.hexdigest() != checksum:
+        raise ValueError(f"Checksum mismatch for {path}: {sha256.hexdigest()} instead of {checksum}")
+    os.replace(path + ".tmp", path)
+    return sha256.hexdigest()
+
+# Multipart body streamed from disk, requests would read the whole (multi GB) snapshot into memory otherwise
+def multipart_file(path, boundary):
+    yield (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"snapshot\"; filename=\"{os.path.basename(path)}\"\r\n"
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+def upload(url, path, checksum):
+    boundary = uuid.uuid4().hex
+    response = requests.put(
+        url,
+        params={"wait": "true", "priority": "snapshot", "checksum": checksum},
+        data=multipart_file(path, boundary),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    response.raise_for_status()
+
+def create(pool, collection_name, path):
+    os.makedirs(path, exist_ok=True)
+    info = pool.get_collection(collection_name)
+    shards = []
+    for shard_id, (shard_key, replicas) in sorted(shard_replicas(pool, collection_name).items()):
+        node, points_count = replicas[0]
+        started = time.perf_counter()
+        snapshot = pool.clients[node].create_shard_snapshot(collection_name, shard_id, wait=True)
+        file_name = f"shard-{shard_id}.snapshot"
+        checksum = download(
+            f"{pool.urls[node]}/collections/{collection_name}/shards/{shard_id}/snapshots/{snapshot.name}",
+            os.path.join(path, file_name),
+            snapshot.checksum
+        )
+        # The snapshot is stored on the client now, free the disk of the node again
+        pool.clients[node].delete_shard_snapshot(collection_name, shard_id, snapshot.name)
+        print(f"Shard {shard_id}: {points_count} points, {snapshot.size / 2**20:.1f} MiB from {pool.urls[node]} in {time.perf_counter() - started:.1f}s")
+        shards.append({"shard_id": shard_id, "shard_key": shard_key, "points_count": points_count, "file": file_name, "checksum": checksum})
+
+    manifest = {
+        "collection_name": collection_name,
+        "created": time.time(),
+        "points_count": pool.count(collection_name, exact=True).count,
+        "indexed_vectors_count": info.indexed_vectors_count,
+        "config": info.config.model_dump(mode="json"),
+        "payload_schema": {field: schema.model_dump(mode="json", exclude_none=True) for field, schema in info.payload_schema.items()},
+        "shards": shards
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Snapshot of {collection_name} with {manifest['points_count']} points in {len(shards)} shards stored in {path}")
+    return manifest
+
+def load_manifest(path):
+    with open(os.path.join(path, "manifest.json")) as f:
+        return json.load(f)
+
+# Create an empty collection with the config of the manifest. A single node gets every shard, with a
+# replication factor of 1. Custom sharding needs one shard key per node, so the number of nodes has to match.
+def recreate_collection(pool, collection_name, manifest):
+    config = models.CollectionConfig.model_validate(manifest["config"])
+    params = config.params
+    custom = params.sharding_method == models.ShardingMethod.CUSTOM
+    shard_keys = {shard["shard_key"] for shard in manifest["shards"]}
+    if custom and len(shard_keys) != len(pool.clients):
+        raise ValueError(f"The snapshot has {len(shard_keys)} shard keys, restoring it needs as many nodes instead of {len(pool.clients)}")
+
+    pool.delete_collection(collection_name=collection_name)
+    replication_factor = min(params.replication_factor or 1, len(pool.clients))
+    pool.create_collection(
+        collection_name=collection_name,
+        vectors_config=params.vectors,
+        sparse_vectors_config=params.sparse_vectors,
+        shard_number=params.shard_number,
+        replication_factor=replication_factor,
+        sharding_method=params.sharding_method,
+        on_disk_payload=params.on_disk_payload,
+        hnsw_config=models.HnswConfigDiff(**config.hnsw_config.model_dump(exclude_none=True)),
+        optimizers_config=models.OptimizersConfigDiff(**config.optimizer_config.model_dump(exclude_none=True)),
+        quantization_config=config.quantization_config,
+        metadata=config.metadata
+    )
+    if custom:
+        pool.create_shard_keys(collection_name, params.shard_number, replication_factor)
+    for field, schema in manifest["payload_schema"].items():
+        pool.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            field_schema=schema.get("params") or schema["data_type"]
+        )
+
+def restore(pool, collection_name, path):
+    manifest = load_manifest(path)
+    started = time.perf_counter()
+    recreate_collection(pool, collection_name, manifest)
+
+    replicas = shard_replicas(pool, collection_name)
+    for shard in manifest["shards"]:
+        shard_key, nodes = replicas.get(shard["shard_id"], (None, []))
+        if not nodes or shard_key != shard["shard_key"]:
+            raise ValueError(f"Shard {shard['shard_id']} ({shard['shard_key']}) of the snapshot has no matching shard in {collection_name}")
+        for node, _ in nodes:
+            upload(
+                f"{pool.urls[node]}/collections/{collection_name}/shards/{shard['shard_id']}/snapshots/upload",
+                os.path.join(path, shard["file"]),
+                shard["checksum"]
+            )
+            print(f"Shard {shard['shard_id']}: restored on {pool.urls[node]}")
+
+    wait_for_index(pool, collection_name)
+    print(f"Restored {collection_name} in {time.perf_counter() - started:.1f}s")
+    return verify(pool, collection_name, manifest)
+
+# Compare a collection with the manifest of its snapshot, returns the list of differences
+def verify(pool, collection_name, manifest):
+    info = pool.get_collection(collection_name)
+    differences = []
+
+    points_count = pool.count(collection_name, exact=True).count
+    if points_count != manifest["points_count"]:
+        differences.append(f"points: {points_count} instead of {manifest['points_count']}")
+    if info.indexed_vectors_count != manifest["indexed_vectors_count"]:
+        differences.append(f"indexed vectors: {info.indexed_vectors_count} instead of {manifest['indexed_vectors_count']}")
+    if set(info.payload_schema) != set(manifest["payload_schema"]):
+        differences.append(f"payload indexes: {sorted(info.payload_schema)} instead of {sorted(manifest['payload_schema'])}")
+
+    replicas = shard_replicas(pool, collection_name)
+    for shard in manifest["shards"]:
+        for node, count in replicas.get(shard["shard_id"], (None, []))[1]:
+            if count != shard["points_count"]:
+                differences.append(f"shard {shard['shard_id']} on {pool.urls[node]}: {count} points instead of {shard['points_count']}")
+
+    for difference in differences:
+        print(f"Mismatch, {difference}")
+    if not differences:
+        print(f"Verified {collection_name}: {points_count} points, {info.indexed_vectors_count} indexed vectors, payload indexes {sorted(info.payload_schema)}")
+    return differences
+
+def main():
+    parser = argparse.ArgumentParser(description="Store the ingested collection as shard snapshots and restore it from them")
+    parser.add_argument("action", choices=["create", "restore", "verify"], help="create: snapshot the collection, restore: recreate it from the snapshot, verify: compare it with the snapshot")
+    parser.add_argument("--path", help="Snapshot directory (default: .snapshots/<collection name>)")
+    parser.add_argument("--hosts", help="Comma separated Qdrant urls to restore onto, for example a local Qdrant binary (default: QDRANT_HOSTS)")
+    args = parser.parse_args()
+
+    collection_name = os.getenv("COLLECTION_NAME")
+    path = args.path or snapshot_dir(collection_name)
+    pool = ClientPool([host.strip() for host in args.hosts.split(",")]) if args.hosts else ClientPool.from_env()
+
+    if args.action == "create":
+        create(pool, collection_name, path)
+        differences = []
+    elif args.action == "restore":
+        differences = restore(pool, collection_name, path)
+    else:
+        differences = verify(pool, collection_name, load_manifest(path))
+    pool.close()
+    sys.exit(1 if differences else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from dbpedia_cache import DENSE_SIZE
+from types import SimpleNamespace
+import numpy as np
+import zlib
+
+# SPLADE model of the sparse vectors, on ingestion and for the queries
+SPARSE_MODEL_NAME = "prithivida/Splade_PP_en_v1"
+
+# Local stand-ins for the embedding models, without any model download or API key. Their results mean nothing,
+# but they are cheap and deterministic, so benchmarks of the pipeline and of the retrieval run offline with them.
+
+# Stand-in for the SPLADE model with the same embed() as fastembed: one dimension per distinct word (hashed into
+# the SPLADE vocabulary size), weighted by its count
+class HashingSparseEmbedding:
+    name = "hashing-sparse"
+    VOCABULARY_SIZE = 30522
+
+    def embed(self, texts, batch_size=None):
+        for text in texts:
+            words, counts = np.unique([zlib.crc32(word.encode()) % self.VOCABULARY_SIZE for word in text.lower().split()], return_counts=True)
+            yield SimpleNamespace(indices=words.astype(np.uint32), values=(1 + np.log(counts)).astype(np.float32))
+
+# Stand-in for the OpenAI embeddings: the normalized sum of a random vector per word, seeded by the word
+class HashingDenseEmbedding:
+    name = f"hashing-{DENSE_SIZE}"
+
+    def embed(self, texts):
+        dense = []
+        for text in texts:
+            vector = np.zeros(DENSE_SIZE, dtype=np.float32)
+            for word in text.lower().split():
+                vector += np.random.default_rng(zlib.crc32(word.encode())).standard_normal(DENSE_SIZE, dtype=np.float32)
+            dense.append(vector / (np.linalg.norm(vector) or 1.0))
+        return dense
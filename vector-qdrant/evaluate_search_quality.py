@@ -0,0 +1,70 @@
+from client_pool import ClientPool
+from search_strategies import STRATEGIES, build_request, search, load_profile
+from search_quality import ground_truth, recall_at_k, ndcg_at_k, mean, format_optional
+from query_set import add_query_arguments, queries_from_args
+from load_test import write_results
+import numpy as np
+import os
+import time
+import argparse
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# Quality versus latency of the search strategies: recall@k and nDCG@k against the exact ground truth
+# (see search_quality.py) next to the latency of the same queries sent one at a time. Shows which fast
+# path, like binary quantization with oversampling=3.0, actually keeps the result quality.
+def evaluate_strategy(client, collection_name, strategy, queries, truth, k, warmup=True, **params):
+    # One untimed round, so the first strategy does not pay for a cold cache
+    if warmup:
+        for query in queries:
+            search(client, collection_name, build_request(strategy, query, limit=k, **params))
+    latencies, recalls, ndcgs = [], [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = search(client, collection_name, build_request(strategy, query, limit=k, **params))
+        latencies.append(time.perf_counter() - started)
+        found = [str(point.id) for point in results.points]
+        recalls.append(recall_at_k(found, expected, k))
+        ndcgs.append(ndcg_at_k(found, expected, k))
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "strategy": strategy,
+        "k": k,
+        "recall": mean(recalls),
+        "ndcg": mean(ndcgs),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        # Queries whose filter matches no point at all have no ground truth and are left out of the means
+        "queries": sum(recall is not None for recall in recalls)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k and nDCG@k of the search strategies against exact ground truth, next to their latency")
+    add_query_arguments(parser, strategies=STRATEGIES)
+    parser.add_argument("--k", type=int, default=10, help="Results per query, recall and nDCG are measured at k (default: 10)")
+    parser.add_argument("--truth", choices=["strategy", "dense"], default="strategy", help="Ground truth: the exact version of every strategy, or the exact dense top k for all of them (default: strategy)")
+    parser.add_argument("--ground-truth-cache", help="JSON file the ground truth is cached in (default: .cache/ground_truth/<COLLECTION_NAME>.json)")
+    args = parser.parse_args()
+
+    client = ClientPool.from_env()
+    collection_name = os.getenv("COLLECTION_NAME")
+    strategies = [strategy.strip() for strategy in args.strategies.split(",")]
+    queries = queries_from_args(args, client, collection_name)
+    profile = load_profile(args.profile)
+
+    rows = []
+    for strategy in strategies:
+        truth = ground_truth(client, collection_name, strategy if args.truth == "strategy" else "dense", queries, args.k, args.ground_truth_cache)
+        row = evaluate_strategy(client, collection_name, strategy, queries, truth, args.k, **profile.get(strategy, {}))
+        rows.append(row)
+        print(f"{strategy}: recall@{args.k} {format_optional(row['recall'], '{:.3f}')}, nDCG@{args.k} {format_optional(row['ndcg'], '{:.3f}')}, p50 {row['p50_ms']:.2f}ms, p95 {row['p95_ms']:.2f}ms ({row['queries']} queries)")
+
+    if args.output:
+        write_results(args.output, rows)
+        print(f"Results written to {args.output}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+from qdrant_client import models
+from datasets import load_dataset
+from fastembed import SparseTextEmbedding
+from client_pool import ClientPool
+from dbpedia_cache import DbpediaCache, DATASET_NAME
+from sparse_pruning import prune, parse_pruning, describe
+from benchmark_storage_profiles import vectors_size_bytes, percentiles
+from embedding_models import SPARSE_MODEL_NAME, HashingSparseEmbedding
+from bulk_load import wait_for_index
+import numpy as np
+import os
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+DEFAULT_CONFIGS = ["top_k=32", "top_k=64", "top_k=128", "mass=0.8", "mass=0.9", "threshold=0.1"]
+
+# Evaluation of SPLADE pruning (see sparse_pruning.py). The texts of the first --points rows are embedded once,
+# then every pruning configuration gets its own sparse-only collection <COLLECTION_NAME>_sparse_<n>, next to the
+# unpruned baseline. The titles of the --queries rows after them are the queries. Per configuration it reports:
+# - index size: postings (non-zero terms) per document and in total, and vectors_size_bytes from the telemetry
+# - sparse query latency (p50/p95), with the queries unpruned and pruned with the same configuration
+# - overlap@k: the share of the baseline top k (unpruned documents and queries) that is still found
+def load_texts(cache_path, points, queries):
+    if cache_path:
+        payload = DbpediaCache(cache_path).payload.slice(0, points + queries)
+        texts, titles = payload.column("text").to_pylist(), payload.column("title").to_pylist()
+    else:
+        rows = list(load_dataset(DATASET_NAME, split="train", streaming=True).take(points + queries))
+        texts, titles = [row["text"] for row in rows], [row["title"] for row in rows]
+    return texts[:points], titles[points:]
+
+def embed(model, texts):
+    return [(embedding.indices, embedding.values) for embedding in model.embed(texts, batch_size=64)]
+
+def create_sparse_collection(client, collection_name, vectors):
+    client.delete_collection(collection_name=collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()}
+    )
+    client.upload_points(
+        collection_name=collection_name,
+        points=[
+            models.PointStruct(id=i, vector={"sparse": models.SparseVector(indices=indices.tolist(), values=values.tolist())})
+            for i, (indices, values) in enumerate(vectors)
+        ],
+        batch_size=256,
+        wait=True
+    )
+    wait_for_index(client, collection_name, interval=2.0, log=lambda message: None)
+
+def search(client, collection_name, queries, k):
+    latencies, results = [], []
+    for indices, values in queries:
+        started = time.perf_counter()
+        response = client.query_points(
+            collection_name=collection_name,
+            query=models.SparseVector(indices=indices.tolist(), values=values.tolist()),
+            using="sparse",
+            limit=k
+        )
+        latencies.append(time.perf_counter() - started)
+        results.append([point.id for point in response.points])
+    return latencies, results
+
+def overlap(results, baseline, k):
+    return float(np.mean([len(set(found) & set(expected[:k])) / max(1, min(k, len(expected))) for found, expected in zip(results, baseline)]))
+
+def evaluate(client, collection_name, pruning, documents, queries, k, baseline=None):
+    vectors = [prune(indices, values, **(pruning or {})) for indices, values in documents]
+    create_sparse_collection(client, collection_name, vectors)
+    postings = sum(len(indices) for indices, _ in vectors)
+    result = {
+        "pruning": describe(pruning),
+        "postings": postings,
+        "postings_per_document": postings / len(vectors),
+        "vectors_size_bytes": vectors_size_bytes(client, collection_name)
+    }
+
+    # One untimed round warms up the page cache the same way for every configuration
+    search(client, collection_name, queries, k)
+    latencies, results = search(client, collection_name, queries, k)
+    result["full_queries"] = {**percentiles(latencies), "overlap": overlap(results, baseline or results, k)}
+    if pruning:
+        pruned_queries = [prune(indices, values, **pruning) for indices, values in queries]
+        latencies, pruned_results = search(client, collection_name, pruned_queries, k)
+        result["pruned_queries"] = {
+            **percentiles(latencies),
+            "overlap": overlap(pruned_results, baseline, k),
+            "terms_per_query": float(np.mean([len(indices) for indices, _ in pruned_queries]))
+        }
+    return result, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate index size, latency and overlap@k of pruned SPLADE vectors against the unpruned baseline")
+    parser.add_argument("--cache", help="Read the texts from a local cache created by dbpedia_cache.py instead of streaming them")
+    parser.add_argument("--points", type=int, default=50000, help="Documents per collection (default: 50000)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries (default: 200)")
+    parser.add_argument("--k", type=int, default=10, help="Results per query, overlap is measured at k (default: 10)")
+    parser.add_argument("--config", action="append", help=f"Pruning configuration like top_k=64 or mass=0.9,top_k=128, can be repeated (default: {' '.join(DEFAULT_CONFIGS)})")
+    parser.add_argument("--embedder", choices=["splade", "hashing"], default="splade", help="Sparse embeddings from SPLADE or from the offline hashing stand-in (default: splade)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    client = ClientPool.from_env()
+    texts, titles = load_texts(args.cache, args.points, args.queries)
+    model = SparseTextEmbedding(model_name=SPARSE_MODEL_NAME, threads=os.cpu_count()) if args.embedder == "splade" else HashingSparseEmbedding()
+    print(f"Embedding {len(texts)} documents and {len(titles)} queries")
+    documents, queries = embed(model, texts), embed(model, titles)
+    configs = [None] + [parse_pruning(dict(setting.split("=") for setting in config.split(","))) for config in args.config or DEFAULT_CONFIGS]
+
+    results, baseline = [], None
+    for n, pruning in enumerate(configs):
+        collection_name = f"{os.getenv('COLLECTION_NAME')}_sparse_{n}"
+        result, found = evaluate(client, collection_name, pruning, documents, queries, args.k, baseline)
+        baseline = baseline or found
+        results.append(result)
+        line = (
+            f"{result['pruning']}: {result['postings_per_document']:.0f} postings per document ({result['vectors_size_bytes'] / 2**20:.1f} MiB), "
+            f"p50 {result['full_queries']['p50_ms']:.2f}ms p95 {result['full_queries']['p95_ms']:.2f}ms overlap@{args.k} {result['full_queries']['overlap']:.3f}"
+        )
+        if "pruned_queries" in result:
+            pruned = result["pruned_queries"]
+            line += f", pruned queries ({pruned['terms_per_query']:.0f} terms): p50 {pruned['p50_ms']:.2f}ms p95 {pruned['p95_ms']:.2f}ms overlap@{args.k} {pruned['overlap']:.3f}"
+        print(line)
+        client.delete_collection(collection_name=collection_name)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
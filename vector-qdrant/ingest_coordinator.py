@@ -0,0 +1,126 @@
+from client_pool import ClientPool
+from checkpoint import Checkpoint
+from dbpedia_cache import DATASET_ROWS
+from bulk_load import finish_load, original_indexing_threshold, format_seconds
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import subprocess
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# A worker without progress for this many seconds is reported as stalled
+STALLED_AFTER = 120
+
+# Coordinator of a horizontally sharded ingestion: every worker (dbpedia_ingest_points_parallel.py with
+# --num-workers and --worker-index) ingests its own slice of the dataset and writes its progress to its checkpoint.
+# The coordinator merges those checkpoints into one summary, and once every worker is done it enables
+# indexing and waits until the collection is green, like a single worker does at the end of its run.
+# With --launch it starts the workers on this host itself, workers on other hosts only need their
+# checkpoint files synced into the checkpoint directory (or a shared one).
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# Rows per second of the current run of a worker
+def worker_rate(state):
+    elapsed = state["updated"] - state["run_started"]
+    return (state["offset"] - state["run_offset"]) / elapsed if elapsed > 0 else 0
+
+def worker_line(worker_index, num_workers, state):
+    if state is None:
+        return f"Worker {worker_index}/{num_workers}: not started"
+    rows, rate = state["rows"], worker_rate(state)
+    line = f"Worker {worker_index}/{num_workers}: {state['offset']}/{rows or '?'} rows"
+    if rows:
+        line += f" ({state['offset'] / rows:.1%})"
+    line += f", {rate:.0f} rows/s"
+    if state["done"]:
+        return line + ", done"
+    if time.time() - state["updated"] > STALLED_AFTER:
+        return line + f", no progress for {format_seconds(time.time() - state['updated'])}"
+    if rows and rate > 0:
+        line += f", ETA {format_seconds((rows - state['offset']) / rate)}"
+    return line
+
+# One line per worker and a total, the slices of workers reading HF shards have no known length,
+# the total then falls back to the size of the dataset
+def summary(states, num_workers, points_count):
+    lines = [worker_line(i, num_workers, state) for i, state in enumerate(states)]
+    started = [state for state in states if state is not None]
+    done = sum(state["offset"] for state in started)
+    known = [state["rows"] for state in started]
+    total = sum(known) if len(known) == num_workers and all(known) else DATASET_ROWS
+    rate = sum(worker_rate(state) for state in started if not state["done"])
+    eta = format_seconds((total - done) / rate) if rate > 0 and total > done else "unknown"
+    lines.append(
+        f"Total: {done}/{total} rows ({done / total:.1%}), {rate:.0f} rows/s, ETA {eta}, "
+        f"workers done: {sum(state['done'] for state in started)}/{num_workers}, points in Qdrant: {points_count if points_count is not None else '?'}"
+    )
+    return "\n".join(lines)
+
+def launch_workers(num_workers, run_id, worker_args):
+    return [
+        subprocess.Popen([
+            sys.executable, "dbpedia_ingest_points_parallel.py",
+            "--num-workers", str(num_workers), "--worker-index", str(i), "--run-id", run_id, *worker_args
+        ])
+        for i in range(num_workers)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the progress of sharded ingest workers and finish the collection once they are done")
+    parser.add_argument("--num-workers", type=int, required=True, help="Number of ingest workers of the run")
+    parser.add_argument("--launch", action="store_true", help="Start the workers on this host, arguments after -- are passed on to them")
+    parser.add_argument("--bulk-load", action="store_true", help="The workers run with --bulk-load, restore the indexing threshold when they are done (passed on with --launch)")
+    parser.add_argument("--snapshot", action="store_true", help="Store shard snapshots of the collection in .snapshots/<collection name> once it is indexed, see dbpedia_snapshot.py")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between two summaries (default: 10)")
+    parser.add_argument("worker_args", nargs="*", help="Arguments for the workers started with --launch")
+    args = parser.parse_args()
+
+    collection_name = os.getenv("COLLECTION_NAME")
+    client = ClientPool.from_env()
+    paths = [Checkpoint.default_path(collection_name, i, args.num_workers) for i in range(args.num_workers)]
+
+    workers = []
+    if args.launch:
+        worker_args = args.worker_args + (["--bulk-load"] if args.bulk_load else [])
+        if "--resume" in worker_args and client.collection_exists(collection_name):
+            # Resumed workers continue from their checkpoints, in the collection of the run they belong to
+            run_id = (client.get_collection(collection_name).config.metadata or {}).get("run_id") or str(uuid.uuid4())
+        else:
+            # Leftover checkpoints of an earlier run would be reported until the new workers overwrite them
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            run_id = str(uuid.uuid4())
+        workers = launch_workers(args.num_workers, run_id, worker_args)
+
+    while True:
+        states = [read_checkpoint(path) for path in paths]
+        points_count = client.get_collection(collection_name).points_count if client.collection_exists(collection_name) else None
+        print(summary(states, args.num_workers, points_count), flush=True)
+        if all(state is not None and state["done"] for state in states):
+            break
+        failed = [i for i, worker in enumerate(workers) if worker.poll() not in (None, 0)]
+        if failed:
+            print(f"Worker(s) {failed} failed, stopping the other workers")
+            for worker in workers:
+                worker.terminate()
+            sys.exit(1)
+        time.sleep(args.interval)
+
+    # Same as the end of a single worker run, with the indexing threshold worker 0 found before the bulk load
+    finish_load(client, collection_name, original_indexing_threshold(client, collection_name) if args.bulk_load else None, args.snapshot)
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+import time
+
+# Client-side metrics of dbpedia_ingest_points_parallel.py, one histogram per pipeline stage so the
+# Grafana ingest dashboard (config/grafana-ingest.json) shows which stage is the bottleneck.
+# The stage timings are per batch:
+# - read: getting the next batch from the dataset stream or the local cache
+# - embed: computing the sparse embeddings inside an embedding process (excluding the wait for a free process)
+# - serialize: turning the batch into columns and protobuf points
+# - upsert: the upsert requests themselves, including the wait for the cluster
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+READ_SECONDS = Histogram("ingest_read_seconds", "Time to read a batch from the dataset", buckets=STAGE_BUCKETS)
+EMBED_SECONDS = Histogram("ingest_embed_seconds", "Time to compute the sparse embeddings of a batch", buckets=STAGE_BUCKETS)
+SERIALIZE_SECONDS = Histogram("ingest_serialize_seconds", "Time to turn a batch into upsert requests", buckets=STAGE_BUCKETS)
+UPSERT_SECONDS = Histogram("ingest_upsert_seconds", "Latency of the upserts of a batch", buckets=STAGE_BUCKETS)
+
+POINTS = Counter("ingest_points", "Points acknowledged by Qdrant")
+BATCHES = Counter("ingest_batches", "Batches acknowledged by Qdrant")
+RETRIES = Counter("ingest_retries", "Upserts retried after an error")
+SPARSE_CACHE_HITS = Counter("ingest_sparse_cache_hits", "Sparse embeddings read from the sparse cache")
+SPARSE_CACHE_MISSES = Counter("ingest_sparse_cache_misses", "Sparse embeddings computed by the model")
+ERRORS = Counter("ingest_errors", "Failed upserts", ["error"])
+
+QUEUE_DEPTH = Gauge("ingest_queue_depth", "Embedded batches waiting for an upload worker")
+IN_FLIGHT = Gauge("ingest_in_flight_upserts", "Upserts in flight")
+BATCH_SIZE = Gauge("ingest_batch_size", "Current batch size")
+CONCURRENCY = Gauge("ingest_concurrency", "Current upload concurrency")
+IN_FLIGHT_BYTES = Gauge("ingest_in_flight_bytes", "Estimated bytes of the batches in flight")
+RSS_BYTES = Gauge("ingest_rss_bytes", "Resident set size of the ingest process")
+PYTHON_HEAP_BYTES = Gauge("ingest_python_heap_bytes", "Python heap traced by tracemalloc")
+
+# Expose the metrics on http://<host>:<port>/metrics for Prometheus
+def serve(port):
+    start_http_server(port)
+
+# The gauges follow the controller and the queue of the running ingestion
+def track(controller, queue_depth):
+    QUEUE_DEPTH.set_function(queue_depth)
+    IN_FLIGHT.set_function(lambda: controller.in_flight)
+    BATCH_SIZE.set_function(lambda: controller.batch_size)
+    CONCURRENCY.set_function(lambda: controller.concurrency)
+
+# The memory gauges follow the byte budget and the memory sampler, when the ingestion has them
+def track_memory(budget, memory):
+    if budget:
+        IN_FLIGHT_BYTES.set_function(lambda: budget.in_flight)
+    if memory:
+        RSS_BYTES.set_function(lambda: memory.rss)
+        PYTHON_HEAP_BYTES.set_function(lambda: memory.traced)
+
+# Yield the items of iterable while timing every next() in histogram
+def timed(iterable, histogram):
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        histogram.observe(time.perf_counter() - started)
+        yield item
+
+def record_embed(seconds, texts, cache_hits):
+    EMBED_SECONDS.observe(seconds)
+    SPARSE_CACHE_HITS.inc(cache_hits)
+    SPARSE_CACHE_MISSES.inc(texts - cache_hits)
+
+def record_error(error):
+    ERRORS.labels(error=type(error).__name__).inc()
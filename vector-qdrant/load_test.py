@@ -0,0 +1,144 @@
+from client_pool import ClientPool
+from search_strategies import STRATEGIES, build_request, search, load_profile
+from query_set import add_query_arguments, queries_from_args
+import search_metrics
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+import itertools
+from collections import Counter
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# Load test of the search strategies of dbpedia_search.py. A single query timed once says little about
+# production, so every strategy runs the query set over and over for --duration seconds, after --warmup
+# seconds that are not counted, in one of two modes:
+# - closed loop (--concurrency): that many threads each send the next query as soon as the previous one returned
+# - open loop (--qps): queries are sent at a fixed rate whether or not the earlier ones returned. The latency is
+#   measured from the moment a query was due, so time spent waiting for a free thread counts as well.
+# The queries are embedded up front, only the Qdrant round trips are measured.
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, started, error=None):
+        latency = time.perf_counter() - started
+        with self.lock:
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors[error.__class__.__name__] += 1
+
+def run_query(run, query, started, results):
+    try:
+        run(query)
+        results.record(started)
+    except Exception as e:
+        results.record(started, e)
+
+def closed_loop(run, queries, duration, concurrency):
+    results, counter = Results(), itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            run_query(run, queries[next(counter) % len(queries)], time.perf_counter(), results)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+def open_loop(run, queries, duration, qps, max_workers):
+    results = Results()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i in itertools.count():
+            due = started + i / qps
+            if due >= started + duration:
+                break
+            time.sleep(max(0.0, due - time.perf_counter()))
+            executor.submit(run_query, run, queries[i % len(queries)], due, results)
+    return results, time.perf_counter() - started
+
+def report(strategy, args, results, elapsed):
+    requests = len(results.latencies) + sum(results.errors.values())
+    latencies = np.asarray(results.latencies or [float("nan")]) * 1000
+    return {
+        "strategy": strategy,
+        "mode": "open" if args.qps else "closed",
+        "concurrency": None if args.qps else args.concurrency,
+        "target_qps": args.qps,
+        "requests": requests,
+        "qps": len(results.latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "error_rate": sum(results.errors.values()) / requests if requests else 0.0,
+        "errors": dict(results.errors)
+    }
+
+def write_results(path, rows):
+    with open(path, "w", newline="") as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows([{key: json.dumps(value) if isinstance(value, (dict, list)) else value for key, value in row.items()} for row in rows])
+        else:
+            json.dump(rows, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the search strategies with a fixed concurrency (closed loop) or a fixed rate (open loop)")
+    add_query_arguments(parser, strategies=STRATEGIES)
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads sending queries in the closed loop (default: 8)")
+    parser.add_argument("--qps", type=float, help="Run an open loop at this rate instead of a closed loop")
+    parser.add_argument("--max-workers", type=int, default=64, help="Threads available to the open loop (default: 64)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per strategy (default: 30)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds per strategy before measuring (default: 5)")
+    parser.add_argument("--limit", type=int, default=5, help="Results per query (default: 5)")
+    parser.add_argument("--metrics-port", type=int, default=os.getenv("SEARCH_METRICS_PORT"), help="Expose the Prometheus metrics of the search side on this port (default: SEARCH_METRICS_PORT)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        search_metrics.serve(int(args.metrics_port))
+        print(f"Serving search metrics on http://localhost:{args.metrics_port}/metrics")
+    client = ClientPool.from_env()
+    collection_name = os.getenv("COLLECTION_NAME")
+    strategies = [strategy.strip() for strategy in args.strategies.split(",")]
+    queries = queries_from_args(args, client, collection_name)
+    profile = load_profile(args.profile)
+    load = (lambda run, duration: open_loop(run, queries, duration, args.qps, args.max_workers)) if args.qps \
+        else (lambda run, duration: closed_loop(run, queries, duration, args.concurrency))
+    print(f"Load testing {', '.join(strategies)} on {collection_name} with {len(queries)} queries, "
+          f"{f'{args.qps:g} QPS open loop' if args.qps else f'concurrency {args.concurrency}'}, {args.warmup:g}s warmup and {args.duration:g}s per strategy")
+
+    rows = []
+    for strategy in strategies:
+        run = lambda query: search(client, collection_name, build_request(strategy, query, limit=args.limit, **profile.get(strategy, {})))
+        if args.warmup > 0:
+            load(run, args.warmup)
+        row = report(strategy, args, *load(run, args.duration))
+        rows.append(row)
+        print(f"{strategy}: {row['qps']:.1f} QPS, p50 {row['p50_ms']:.2f}ms, p95 {row['p95_ms']:.2f}ms, p99 {row['p99_ms']:.2f}ms, "
+              f"max {row['max_ms']:.2f}ms, errors {row['error_rate']:.2%} {row['errors'] or ''}")
+
+    if args.output:
+        write_results(args.output, rows)
+        print(f"Results written to {args.output}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
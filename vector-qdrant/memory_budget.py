@@ -0,0 +1,100 @@
+import os
+import sys
+import resource
+import threading
+import tracemalloc
+import numpy as np
+
+# Backpressure on the estimated bytes of the batches in flight, next to the number of batches the queue allows.
+# A batch of streamed rows holds its dense vectors as Python lists of floats (32 bytes per dimension) plus the
+# texts, so a single batch of a few hundred rows runs to many MB. A batch is admitted as long as the batches
+# in flight stay below max_bytes, or when nothing else is in flight, so an oversized batch still gets through on its own.
+class ByteBudget:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    # Returns False when the budget did not free up within timeout seconds
+    def acquire(self, size, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.max_bytes, timeout):
+                return False
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self, size):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+# Estimated memory of a batch of dataset rows: the dict of every row, its strings and its dense vector
+# (a list of Python floats from the stream, or a numpy view from the local cache).
+# Column batches of the local cache (see dbpedia_cache.py) know the bytes of their slices.
+def batch_bytes(batch):
+    if hasattr(batch, "nbytes"):
+        return batch.nbytes
+    size = 0
+    for item in batch:
+        size += sys.getsizeof(item)
+        for value in item.values():
+            if isinstance(value, list):
+                size += sys.getsizeof(value) + len(value) * sys.getsizeof(0.0)
+            elif isinstance(value, np.ndarray):
+                size += value.nbytes
+            else:
+                size += sys.getsizeof(value)
+    return size
+
+# Resident set size of this process, the embedding processes have their own
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not Linux: only the peak is known, in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# Samples the RSS (and with trace=True the Python heap through tracemalloc, which slows allocations down)
+# every interval seconds in a background thread, keeping the current and the peak values
+class MemorySampler:
+    def __init__(self, interval=1.0, trace=False):
+        self.interval = interval
+        self.trace = trace
+        self.rss = self.peak_rss = rss_bytes()
+        self.traced = self.peak_traced = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        if self.trace:
+            tracemalloc.stop()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        self.rss = rss_bytes()
+        self.peak_rss = max(self.peak_rss, self.rss)
+        if self.trace and tracemalloc.is_tracing():
+            self.traced, peak = tracemalloc.get_traced_memory()
+            self.peak_traced = max(self.peak_traced, peak)
+
+    def summary(self):
+        line = f"RSS {self.rss / 2**20:.0f} MiB (peak {self.peak_rss / 2**20:.0f} MiB)"
+        if self.trace:
+            line += f", Python heap {self.traced / 2**20:.0f} MiB (peak {self.peak_traced / 2**20:.0f} MiB)"
+        return line
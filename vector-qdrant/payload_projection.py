@@ -0,0 +1,43 @@
+from qdrant_client import models
+from sqlite_store import KeyValueStore
+
+# Payload fields the dataset rows bring along (next to the dense vector), plus the user_id added on ingestion
+PAYLOAD_FIELDS = ["_id", "title", "text", "user_id"]
+
+# Payload indexes of the collection, field name -> schema
+PAYLOAD_INDEXES = {"user_id": models.PayloadSchemaType.INTEGER}
+
+# Payload projection: only the selected fields are upserted. The text is by far the largest field, leaving it out
+# (or moving it to the text store below) shrinks every upsert, the WAL and the payload storage of the cluster.
+# Searches filter on user_id and print the title, so those are the fields worth keeping.
+def project(payload, fields=None, text_store=None):
+    return {
+        key: column for key, column in payload.items()
+        if (fields is None or key in fields) and not (text_store and key == "text")
+    }
+
+# Create the payload indexes the collection does not have yet. Before the load every indexed point costs
+# an index update, after the load every index is built in one pass over the stored payloads.
+def create_payload_indexes(client, collection_name):
+    existing = client.get_collection(collection_name).payload_schema
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True
+            )
+
+# External store for the text of the points, keyed by point id, so the text stays available without being a payload.
+# A SQLite table like sparse_cache.py (see sqlite_store.py), shared by the upload threads of one ingest process.
+class TextStore(KeyValueStore):
+    def __init__(self, path):
+        super().__init__(path, "text", "id", "text", "TEXT", "TEXT")
+
+    def put_many(self, ids, texts):
+        super().put_many([str(i) for i in ids], texts)
+
+    # The text of every id, None for ids that are not in the store
+    def get_many(self, ids):
+        return super().get_many([str(i) for i in ids])
@@ -0,0 +1,176 @@
+from openai import OpenAI
+from fastembed import SparseTextEmbedding
+from dbpedia_cache import DENSE_SIZE
+from embedding_models import SPARSE_MODEL_NAME, HashingDenseEmbedding, HashingSparseEmbedding
+from sparse_cache import encode as encode_sparse, decode as decode_sparse
+from sqlite_store import KeyValueStore
+from search_metrics import EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES, EMBED_SECONDS
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
+import time
+import os
+
+DENSE_MODEL_NAME = "text-embedding-3-large"
+
+# Query embeddings with a two-level cache. Every query needs a round trip to OpenAI and a SPLADE inference
+# before it reaches Qdrant, which costs more than the search itself, and many queries are asked again.
+# - memory: an LRU of the most recent embeddings, per process
+# - disk: a SQLite table like sparse_cache.py (see sqlite_store.py), shared by processes and kept across runs.
+#   The dense and sparse embeddings of all models live in the same table.
+# The key is the model and the normalized text: whitespace collapsed, and lowercased for the sparse model only
+# (the SPLADE tokenizer is uncased, the OpenAI model is not). The models always embed the original text.
+# Hits (per level) and misses are exported in search_metrics.py.
+#
+# The "hashing" embedders are the local stand-ins of embedding_models.py, benchmarks of the retrieval run
+# offline with them.
+def normalize(text, lowercase=False):
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+class OpenAIDenseEmbedding:
+    name = f"{DENSE_MODEL_NAME}-{DENSE_SIZE}"
+
+    def __init__(self):
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def embed(self, texts):
+        dense = []
+        for start in range(0, len(texts), 100):
+            response = self.client.embeddings.create(input=texts[start:start + 100], model=DENSE_MODEL_NAME, dimensions=DENSE_SIZE)
+            dense += [np.asarray(item.embedding, dtype=np.float32) for item in response.data]
+        return dense
+
+class SpladeSparseEmbedding:
+    name = SPARSE_MODEL_NAME
+
+    def __init__(self, threads=4):
+        self.model = SparseTextEmbedding(model_name=SPARSE_MODEL_NAME, threads=threads)
+
+    def embed(self, texts):
+        return [(embedding.indices, embedding.values) for embedding in self.model.embed(texts)]
+
+# The hashing stand-in of embedding_models.py, returning (indices, values) pairs like SpladeSparseEmbedding
+class HashingSparseQueryEmbedding(SpladeSparseEmbedding):
+    name = HashingSparseEmbedding.name
+
+    def __init__(self):
+        self.model = HashingSparseEmbedding()
+
+EMBEDDERS = {
+    "openai": (OpenAIDenseEmbedding, SpladeSparseEmbedding),
+    "hashing": (HashingDenseEmbedding, HashingSparseQueryEmbedding)
+}
+
+# One model behind both cache levels. The vectors are dense float32 arrays or sparse (indices, values) pairs.
+class CachedEmbedding:
+    def __init__(self, model, sparse, disk=None, memory_size=1024):
+        self.model = model
+        self.sparse = sparse
+        self.disk = disk
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model.name}\0{normalize(text, lowercase=self.sparse)}".encode()).digest()
+
+    def encode(self, vector):
+        return encode_sparse(*vector) if self.sparse else np.asarray(vector, dtype="<f4").tobytes()
+
+    def decode(self, blob):
+        return decode_sparse(blob) if self.sparse else np.frombuffer(blob, dtype="<f4")
+
+    def remember(self, key, vector):
+        with self.lock:
+            self.memory[key] = vector
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def count(self, level, n):
+        if n:
+            self.hits[level] += n
+            EMBEDDING_CACHE_HITS.labels(model=self.model.name, level=level).inc(n)
+
+    def embed(self, texts):
+        keys = [self.key(text) for text in texts]
+        vectors = [None] * len(texts)
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    vectors[i] = self.memory[key]
+        self.count("memory", sum(vector is not None for vector in vectors))
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.disk:
+            for i, blob in zip(missing, self.disk.get_many([keys[i] for i in missing])):
+                if blob is not None:
+                    vectors[i] = self.decode(blob)
+                    self.remember(keys[i], vectors[i])
+            self.count("disk", sum(vectors[i] is not None for i in missing))
+            missing = [i for i in missing if vectors[i] is None]
+
+        if missing:
+            # Texts with the same key in the same call are only computed once, from the first original text
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            started = time.perf_counter()
+            computed = dict(zip(unique, self.model.embed(list(unique.values()))))
+            EMBED_SECONDS.labels(model=self.model.name).observe(time.perf_counter() - started)
+            self.misses += len(missing)
+            EMBEDDING_CACHE_MISSES.labels(model=self.model.name).inc(len(missing))
+            for i in missing:
+                vectors[i] = computed[keys[i]]
+                self.remember(keys[i], vectors[i])
+            if self.disk:
+                new_keys = {keys[i]: vectors[i] for i in missing}
+                self.disk.put_many(list(new_keys), [self.encode(vector) for vector in new_keys.values()])
+        return vectors
+
+    def stats(self):
+        return f"{self.model.name}: {self.hits['memory']} memory hits, {self.hits['disk']} disk hits, {self.misses} computed"
+
+# Dense and sparse query embeddings, by default configured from the environment:
+# QUERY_EMBEDDER (openai or hashing), QUERY_EMBEDDING_CACHE (SQLite file) and QUERY_EMBEDDING_CACHE_SIZE
+class QueryEmbedder:
+    def __init__(self, embedder=None, cache_path=None, memory_size=None):
+        embedder = embedder or os.getenv("QUERY_EMBEDDER", "openai")
+        cache_path = cache_path or os.getenv("QUERY_EMBEDDING_CACHE")
+        memory_size = memory_size or int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+        if embedder not in EMBEDDERS:
+            raise ValueError(f"Unknown query embedder {embedder}, expected one of {', '.join(EMBEDDERS)}")
+        dense_model, sparse_model = EMBEDDERS[embedder]
+        self.disk = KeyValueStore(cache_path, "embeddings") if cache_path else None
+        # The models are only loaded once an embedding is missing from the cache
+        self.dense = CachedEmbedding(LazyModel(dense_model), False, self.disk, memory_size)
+        self.sparse = CachedEmbedding(LazyModel(sparse_model), True, self.disk, memory_size)
+
+    # (dense, (indices, values)) of every text
+    def embed(self, texts):
+        return list(zip(self.dense.embed(texts), self.sparse.embed(texts)))
+
+    def stats(self):
+        return f"{self.dense.stats()}; {self.sparse.stats()}"
+
+    def close(self):
+        if self.disk:
+            self.disk.close()
+
+class LazyModel:
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.name = model_class.name
+        self.model = None
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        with self.lock:
+            if self.model is None:
+                self.model = self.model_class()
+        return self.model.embed(texts)
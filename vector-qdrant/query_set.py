@@ -0,0 +1,78 @@
+from qdrant_client import models
+from datasets import load_dataset
+from dbpedia_cache import DbpediaCache, DATASET_NAME, DENSE_FIELD
+from sparse_pruning import prune, pruning_from_env
+from storage_profiles import collection_profile, encode_query
+from query_embeddings import QueryEmbedder, EMBEDDERS
+import numpy as np
+import random
+import os
+
+# Query sets for the load test and the evaluations, as the query dicts of search_strategies.py.
+# - From a text file (one query per line): the embeddings come from the query embedder (see query_embeddings.py),
+#   OpenAI and SPLADE like in dbpedia_search.py, or the offline stand-in with QUERY_EMBEDDER=hashing
+# - Sampled from the dataset: the title is the query text and the dataset vector of the row the dense query,
+#   so no OpenAI calls are needed
+# The sparse vectors are pruned with SPARSE_QUERY_* like in dbpedia_search.py. The user_id to filter on
+# is random but seeded by the query text, so a query set always runs the same filters.
+def read_texts(path, count=None):
+    with open(path) as f:
+        texts = [line.strip() for line in f if line.strip()]
+    return texts[:count] if count else texts
+
+def sample_rows(count, cache_path=None, seed=0):
+    if cache_path:
+        cache = DbpediaCache(cache_path)
+        rows = np.sort(np.random.default_rng(seed).choice(len(cache), size=min(count, len(cache)), replace=False))
+        titles = cache.payload.column("title").take(rows).to_pylist()
+        return titles, np.asarray(cache.dense[rows], dtype=np.float32)
+    items = list(load_dataset(DATASET_NAME, split="train", streaming=True).take(count))
+    return [item["title"] for item in items], np.asarray([item[DENSE_FIELD] for item in items], dtype=np.float32)
+
+def query_user_id(text):
+    return random.Random(text).randint(1, 10)
+
+# The query dict of search_strategies.py for a text and its embeddings
+def make_query(text, dense, sparse, profile, pruning=None):
+    indices, values = prune(*sparse, **(pruning or {}))
+    return {
+        "text": text,
+        # Collections with the uint8 storage profile need the query mapped onto 0..255 as well
+        "dense": encode_query(profile, dense),
+        "sparse": models.SparseVector(indices=indices.tolist(), values=values.tolist()),
+        "user_id": query_user_id(text)
+    }
+
+def load_queries(client, collection_name, count=100, path=None, cache_path=None, seed=0, embedder=None):
+    embedder = embedder or QueryEmbedder()
+    if path:
+        texts = read_texts(path, count)
+        dense, sparse = zip(*embedder.embed(texts))
+    else:
+        texts, dense = sample_rows(count, cache_path, seed)
+        sparse = embedder.sparse.embed(texts)
+    print(f"Query embeddings: {embedder.stats()}")
+    profile = collection_profile(client, collection_name)
+    pruning = pruning_from_env("SPARSE_QUERY_")
+    return [make_query(text, vector, vector_sparse, profile, pruning) for text, vector, vector_sparse in zip(texts, dense, sparse)]
+
+# The command line arguments of the query set, shared by the load test, the evaluations and the benchmarks.
+# --strategies is only added with a default list (the strategies of the script), --profile and --output can be left out.
+def add_query_arguments(parser, num_queries=100, strategies=None, profile=True, output=True):
+    if strategies:
+        parser.add_argument("--strategies", default=",".join(strategies), help=f"Comma separated strategies to run (default: {','.join(strategies)})")
+    parser.add_argument("--queries-file", help="Text file with one query per line, embedded by the query embedder (default: titles sampled from the dataset)")
+    parser.add_argument("--cache", help="Sample the queries from a local cache created by dbpedia_cache.py instead of the streamed dataset")
+    parser.add_argument("--embedder", choices=list(EMBEDDERS), help="Query embedder, hashing is an offline stand-in so only the retrieval is measured (default: QUERY_EMBEDDER or openai)")
+    parser.add_argument("--num-queries", type=int, default=num_queries, help=f"Size of the query set (default: {num_queries})")
+    if profile:
+        parser.add_argument("--profile", help="Search profile written by search_autotune.py (default: SEARCH_PROFILE, or the default parameters)")
+    if output:
+        parser.add_argument("--output", help="Write the results to this file, CSV when it ends in .csv and JSON otherwise")
+
+# The query set of the parsed arguments of add_query_arguments, on COLLECTION_NAME by default
+def queries_from_args(args, client, collection_name=None):
+    embedder = QueryEmbedder(args.embedder)
+    queries = load_queries(client, collection_name or os.getenv("COLLECTION_NAME"), args.num_queries, args.queries_file, args.cache, embedder=embedder)
+    embedder.close()
+    return queries
@@ -0,0 +1,100 @@
+from search_strategies import build_request, search, load_profile
+from search_metrics import RESULT_CACHE_HITS, RESULT_CACHE_MISSES, RESULT_CACHE_INVALIDATIONS
+from query_embeddings import QueryEmbedder, normalize
+from query_set import make_query
+from sparse_pruning import pruning_from_env
+from storage_profiles import collection_profile
+from collections import OrderedDict
+import os
+import json
+import time
+import threading
+
+# Result cache for hot queries: a repeated search skips both the embedding calls and the round trip to the cluster.
+# - The key is the strategy, the query text with its whitespace collapsed (the dense model is case-sensitive),
+#   the user_id filter, the limit and the search parameters
+# - Entries expire after ttl seconds, and the least recently used ones are evicted beyond max_entries
+# - Every check_interval seconds the version of the collection is read: the collection an alias points to,
+#   the data_version in its metadata and its number of points. When it changed the whole cache is dropped,
+#   results of an older version of the collection are never served after that.
+# The ingestion bumps data_version when it is done, other writers can call bump_data_version() of bulk_load.py as well.
+# Updates that neither change the number of points nor bump the version are only picked up after the TTL.
+def collection_version(client, collection_name):
+    aliases = {alias.alias_name: alias.collection_name for alias in client.get_aliases().aliases}
+    target = aliases.get(collection_name, collection_name)
+    info = client.get_collection(target)
+    return target, (info.config.metadata or {}).get("data_version"), info.points_count
+
+class ResultCache:
+    def __init__(self, client, collection_name, max_entries=None, ttl=None, check_interval=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_entries = max_entries or int(os.getenv("RESULT_CACHE_SIZE", 10000))
+        self.ttl = ttl or float(os.getenv("RESULT_CACHE_TTL", 300))
+        self.check_interval = check_interval or float(os.getenv("RESULT_CACHE_CHECK_INTERVAL", 5))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = 0.0
+
+    def key(self, strategy, text, user_id, limit, params):
+        return json.dumps([strategy, normalize(text), user_id, limit, sorted(params.items())])
+
+    # Drop everything when the collection changed, at most once per check_interval
+    def check_version(self):
+        if time.monotonic() - self.checked < self.check_interval:
+            return
+        version = collection_version(self.client, self.collection_name)
+        with self.lock:
+            self.checked = time.monotonic()
+            if self.version is not None and version != self.version:
+                self.entries.clear()
+                RESULT_CACHE_INVALIDATIONS.inc()
+            self.version = version
+
+    def get(self, key):
+        self.check_version()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() < entry[0]:
+                self.entries.move_to_end(key)
+                RESULT_CACHE_HITS.inc()
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+        RESULT_CACHE_MISSES.inc()
+        return None
+
+    # version is the one the value was searched at, a value searched before an invalidation is not stored
+    def put(self, key, value, version):
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+# Searches by query text through the result cache, embedding and searching only on a miss.
+# The points returned are shared with the cache and should not be modified.
+class CachedSearcher:
+    def __init__(self, client, collection_name, embedder=None, profile=None, cache=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.embedder = embedder or QueryEmbedder()
+        self.profile = load_profile() if profile is None else profile
+        self.cache = cache or ResultCache(client, collection_name)
+        self.storage_profile = collection_profile(client, collection_name)
+        self.pruning = pruning_from_env("SPARSE_QUERY_")
+
+    def search(self, strategy, text, user_id=None, limit=5):
+        params = self.profile.get(strategy, {})
+        key = self.cache.key(strategy, text, user_id, limit, params)
+        points = self.cache.get(key)
+        if points is None:
+            version = self.cache.version
+            dense, sparse = self.embedder.embed([text])[0]
+            query = {**make_query(text, dense, sparse, self.storage_profile, self.pruning), "user_id": user_id}
+            points = search(self.client, self.collection_name, build_request(strategy, query, limit=limit, **params)).points
+            self.cache.put(key, points, version)
+        return points
@@ -0,0 +1,129 @@
+from client_pool import ClientPool
+from search_strategies import STRATEGIES, TUNABLE, OVERSAMPLING, PREFETCH_LIMIT
+from search_quality import ground_truth
+from evaluate_search_quality import evaluate_strategy
+from query_set import add_query_arguments, queries_from_args
+from load_test import write_results
+import os
+import json
+import time
+import argparse
+import itertools
+from dotenv import load_dotenv
+
+# Force reloading the environment variables
+load_dotenv(override=True)
+
+# Autotuner of the search parameters. oversampling=3.0, a prefetch limit of 20 and the default hnsw_ef are
+# guesses, the right values depend on the collection and the recall that is needed. For every strategy the
+# tuner measures recall@k and latency (see evaluate_search_quality.py) of every combination of its tunable
+# parameters (TUNABLE in search_strategies.py), keeps the Pareto front (no other combination is both faster
+# and more accurate) and picks the cheapest combination on it that reaches --target-recall.
+# The choices are written as a profile which the search code loads from SEARCH_PROFILE.
+# The ground truth of the fusion strategies uses one large exact prefetch for every combination (at least the
+# largest swept prefetch limit), otherwise a small prefetch limit would be measured against a truth just as small.
+def parse_values(text, cast):
+    return [None if value.strip() == "default" else cast(value) for value in text.split(",")]
+
+def grid(strategy, values):
+    names = TUNABLE[strategy]
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+# Measurements that no other measurement beats on both recall and cost, sorted by cost
+def pareto_front(rows, cost):
+    front = [
+        row for row in rows
+        if not any(
+            other[cost] <= row[cost] and other["recall"] >= row["recall"] and (other[cost] < row[cost] or other["recall"] > row["recall"])
+            for other in rows
+        )
+    ]
+    return sorted(front, key=lambda row: row[cost])
+
+# The cheapest point of the front reaching the target, or the most accurate one when none does
+def choose(front, cost, target_recall):
+    reaching = [row for row in front if row["recall"] >= target_recall]
+    if reaching:
+        return min(reaching, key=lambda row: row[cost]), True
+    return max(front, key=lambda row: (row["recall"], -row[cost])), False
+
+def format_params(params):
+    return ", ".join(f"{name}={'default' if value is None else value}" for name, value in params.items()) or "no parameters"
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep oversampling, hnsw_ef and prefetch limits per strategy and write the cheapest parameters reaching a target recall")
+    add_query_arguments(parser, num_queries=50, strategies=[strategy for strategy in STRATEGIES if TUNABLE[strategy]], profile=False, output=False)
+    parser.add_argument("--k", type=int, default=10, help="Results per query, recall is measured at k (default: 10)")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="Recall@k the chosen parameters have to reach (default: 0.95)")
+    parser.add_argument("--cost", choices=["p50_ms", "p95_ms"], default="p95_ms", help="Latency to minimize (default: p95_ms)")
+    parser.add_argument("--oversampling", default=f"1.0,1.5,2.0,{OVERSAMPLING},4.0,6.0", help="Oversampling values to try")
+    parser.add_argument("--prefetch-limit", default=f"10,{PREFETCH_LIMIT},40,80", help="Prefetch limits to try")
+    parser.add_argument("--hnsw-ef", default="default,32,64,128,256", help="hnsw_ef values to try, default is the one of the collection")
+    parser.add_argument("--truth-prefetch-limit", type=int, default=100, help="Candidates per exact prefetch of the ground truth of rrf and bq_rrf, raised to the largest --prefetch-limit (default: 100)")
+    parser.add_argument("--ground-truth-cache", help="JSON file the ground truth is cached in (default: .cache/ground_truth/<COLLECTION_NAME>.json)")
+    parser.add_argument("--output", default="search_profile.json", help="Profile to write (default: search_profile.json)")
+    parser.add_argument("--report", help="Write every measurement to this file, CSV when it ends in .csv and JSON otherwise")
+    args = parser.parse_args()
+
+    client = ClientPool.from_env()
+    collection_name = os.getenv("COLLECTION_NAME")
+    strategies = [strategy.strip() for strategy in args.strategies.split(",")]
+    values = {
+        "oversampling": parse_values(args.oversampling, float),
+        "prefetch_limit": parse_values(args.prefetch_limit, int),
+        "hnsw_ef": parse_values(args.hnsw_ef, int)
+    }
+    truth_prefetch_limit = max([args.truth_prefetch_limit] + [limit for limit in values["prefetch_limit"] if limit is not None])
+    queries = queries_from_args(args, client, collection_name)
+
+    profile = {
+        "collection": collection_name,
+        "k": args.k,
+        "target_recall": args.target_recall,
+        "cost": args.cost,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "strategies": {}
+    }
+    measurements = []
+    for strategy in strategies:
+        truth = ground_truth(client, collection_name, strategy, queries, args.k, args.ground_truth_cache, truth_prefetch_limit)
+        combinations = grid(strategy, values)
+        print(f"Tuning {strategy}: {len(combinations)} combinations of {', '.join(TUNABLE[strategy]) or 'nothing'} on {len(queries)} queries")
+        rows = []
+        for i, params in enumerate(combinations):
+            # The first combination warms up the caches, so it does not pay for them
+            row = evaluate_strategy(client, collection_name, strategy, queries, truth, args.k, warmup=i == 0, **params)
+            rows.append({**row, "params": params})
+        measurements += rows
+
+        # Without any query whose filter matches a point there is no recall to tune for
+        if rows[0]["recall"] is None:
+            print(f"  No query of the sample has a ground truth for {strategy}, keeping its defaults")
+            continue
+        front = pareto_front(rows, args.cost)
+        print(f"  Pareto front of {strategy}:")
+        for row in front:
+            print(f"    recall@{args.k} {row['recall']:.3f}, {args.cost} {row[args.cost]:.2f}ms: {format_params(row['params'])}")
+        chosen, reached = choose(front, args.cost, args.target_recall)
+        if not reached:
+            print(f"  No combination reaches recall@{args.k} {args.target_recall}, taking the most accurate one")
+        print(f"  Chosen: {format_params(chosen['params'])} (recall@{args.k} {chosen['recall']:.3f}, {args.cost} {chosen[args.cost]:.2f}ms)")
+        profile["strategies"][strategy] = {
+            "params": chosen["params"],
+            "recall": chosen["recall"],
+            "p50_ms": chosen["p50_ms"],
+            "p95_ms": chosen["p95_ms"],
+            "reached_target": reached,
+            "pareto_front": [{"params": row["params"], "recall": row["recall"], args.cost: row[args.cost]} for row in front]
+        }
+
+    with open(args.output, "w") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Profile written to {args.output}, load it with SEARCH_PROFILE={args.output}")
+    if args.report:
+        write_results(args.report, measurements)
+        print(f"Measurements written to {args.report}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
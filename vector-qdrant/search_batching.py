@@ -0,0 +1,69 @@
+from search_strategies import search_batch
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
+import threading
+import time
+
+# Micro-batching of concurrent searches. Every search() call of any thread is queued, and a dispatcher thread
+# sends the requests that arrived within window seconds after the first one (up to max_batch_size of them)
+# as one query_batch_points round trip. A caller waits at most the window longer, in exchange for one request
+# and one round of gRPC overhead per batch instead of per query. The requests may be of different strategies.
+# Up to max_in_flight batches are sent at the same time, so the next batch is collected while one is in flight.
+class MicroBatcher:
+    def __init__(self, client, collection_name, window=0.002, max_batch_size=64, max_in_flight=4):
+        self.client = client
+        self.collection_name = collection_name
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.requests = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.in_flight = threading.Semaphore(max_in_flight)
+        self.batch_sizes = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Blocks until the batch of the request returned, the response is the same as search_strategies.search()
+    def search(self, request):
+        future = Future()
+        self.requests.put((request, future))
+        return future.result()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.requests.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self.requests.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.in_flight.acquire()
+            self.batch_sizes.append(len(batch))
+            self.executor.submit(self.send, batch)
+
+    def send(self, batch):
+        try:
+            responses = search_batch(self.client, self.collection_name, [request for request, _ in batch])
+            for (_, future), response in zip(batch, responses):
+                future.set_result(response)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        finally:
+            self.in_flight.release()
+
+    def mean_batch_size(self):
+        return sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else 0.0
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
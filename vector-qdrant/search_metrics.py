@@ -0,0 +1,20 @@
+from prometheus_client import Counter, Histogram, start_http_server
+
+# Client-side metrics of the search side, like ingest_metrics.py for the ingestion.
+# The query embedding cache (see query_embeddings.py) has two levels, memory and disk, a miss at both
+# levels means the model computed the embedding.
+EMBED_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+EMBEDDING_CACHE_HITS = Counter("search_embedding_cache_hits", "Query embeddings read from the cache", ["model", "level"])
+EMBEDDING_CACHE_MISSES = Counter("search_embedding_cache_misses", "Query embeddings computed by the model", ["model"])
+EMBED_SECONDS = Histogram("search_embed_seconds", "Time to compute the embeddings missing from the cache", ["model"], buckets=EMBED_BUCKETS)
+
+# The result cache (see result_cache.py) answers repeated searches without embedding or searching,
+# it is emptied whenever the collection changed
+RESULT_CACHE_HITS = Counter("search_result_cache_hits", "Searches answered from the result cache")
+RESULT_CACHE_MISSES = Counter("search_result_cache_misses", "Searches sent to the cluster")
+RESULT_CACHE_INVALIDATIONS = Counter("search_result_cache_invalidations", "Times the result cache was emptied because the collection changed")
+
+# Expose the metrics on http://<host>:<port>/metrics for Prometheus
+def serve(port):
+    start_http_server(port)
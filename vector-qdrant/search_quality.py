@@ -0,0 +1,86 @@
+from search_strategies import PREFETCH_LIMIT, build_request, search
+from storage_profiles import collection_profile
+import numpy as np
+import os
+import json
+import hashlib
+
+# Result quality of the search strategies against exact ground truth.
+# The ground truth of a strategy is the same strategy with every approximation turned off (exact=True in
+# search_strategies.py: no HNSW graph, no quantized vectors), or with truth="dense" the exact dense top k of
+# the query for every strategy. Computing it scans the whole collection per query, so it is cached in a JSON
+# file per collection, keyed by the truth, k and the query. The key of a query covers its vectors as well as
+# its text, so another embedder, sparse pruning setting or query source never reuses a stale ground truth.
+# The cache is dropped once the number of points or the storage profile of the collection changed,
+# the ground truth of a different collection is of no use.
+def query_key(query):
+    digest = hashlib.sha256(f"{query['text']}\0{query['user_id']}\0".encode())
+    digest.update(np.asarray(query["dense"], dtype="<f4").tobytes())
+    digest.update(np.asarray(query["sparse"].indices, dtype="<u4").tobytes())
+    digest.update(np.asarray(query["sparse"].values, dtype="<f4").tobytes())
+    return digest.hexdigest()[:16]
+
+def default_cache_path(collection_name):
+    return os.path.join(".cache", "ground_truth", f"{collection_name}.json")
+
+def load_cache(path, points_count, storage_profile):
+    empty = {"points_count": points_count, "storage_profile": storage_profile, "truth": {}}
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return empty
+    if cache["points_count"] != points_count:
+        print(f"Collection changed from {cache['points_count']} to {points_count} points, recomputing the ground truth")
+        return empty
+    if cache.get("storage_profile") != storage_profile:
+        print(f"Storage profile changed from {cache.get('storage_profile')} to {storage_profile}, recomputing the ground truth")
+        return empty
+    return cache
+
+def save_cache(path, cache):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(path + ".tmp", path)
+
+# Exact top k point ids of every query, in order. prefetch_limit is the number of candidates of every exact
+# prefetch of the fusion strategies, the ground truth of another limit is cached apart.
+def ground_truth(client, collection_name, truth, queries, k, cache_path=None, prefetch_limit=PREFETCH_LIMIT):
+    cache_path = cache_path or default_cache_path(collection_name)
+    cache = load_cache(cache_path, client.get_collection(collection_name).points_count, collection_profile(client, collection_name))
+    prefix = f"{truth}/{k}/" if prefetch_limit == PREFETCH_LIMIT else f"{truth}/{k}/p{prefetch_limit}/"
+    keys = [prefix + query_key(query) for query in queries]
+    missing = [(key, query) for key, query in zip(keys, queries) if key not in cache["truth"]]
+    if missing:
+        print(f"Computing the exact top {k} of {len(missing)} queries for {truth} ({len(queries) - len(missing)} cached)")
+        for key, query in missing:
+            results = search(client, collection_name, build_request(truth, query, limit=k, prefetch_limit=prefetch_limit, exact=True))
+            cache["truth"][key] = [str(point.id) for point in results.points]
+        save_cache(cache_path, cache)
+    return [cache["truth"][key] for key in keys]
+
+# Share of the exact top k that was found, None when the ground truth is empty (no point matches the filter)
+def recall_at_k(found, truth, k):
+    expected = set(truth[:k])
+    if not expected:
+        return None
+    return len(set(found[:k]) & expected) / len(expected)
+
+# nDCG@k with the exact top k as the relevant results (binary relevance): a relevant result found further
+# down the list counts less than one found in its place
+def ndcg_at_k(found, truth, k):
+    expected = set(truth[:k])
+    if not expected:
+        return None
+    dcg = sum(1 / np.log2(rank + 2) for rank, point_id in enumerate(found[:k]) if point_id in expected)
+    ideal = sum(1 / np.log2(rank + 2) for rank in range(len(expected)))
+    return dcg / ideal
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    return float(np.mean(values)) if values else None
+
+# A mean that may be None formatted for printing
+def format_optional(value, pattern):
+    return "n/a" if value is None else pattern.format(value)
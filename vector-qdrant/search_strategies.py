@@ -0,0 +1,126 @@
+from qdrant_client import models
+import os
+import json
+
+# The search strategies of dbpedia_search.py as requests, so the demo, the load test and the evaluations
+# all run exactly the same queries. A query is a dict with the dense vector (already encoded for the
+# storage profile of the collection), the sparse vector (a models.SparseVector) and the user_id to filter on.
+STRATEGIES = {
+    "dense": "Dense vector + Filtering",
+    "sparse": "Sparse vector + Filtering",
+    "dense_bq": "Dense vector with Binary Quantization + Filtering",
+    "rrf": "Reciprocal Rank Fusion with Dense vector + Sparse vector + Filtering",
+    "bq_rrf": "Reciprocal Rank Fusion with Dense vector and Binary Quantization + Sparse vector + Filtering"
+}
+
+# Oversampling of the binary quantized dense vector, ideal value for openai 1536
+OVERSAMPLING = 3.0
+# Candidates every prefetch of a fusion query brings along
+PREFETCH_LIMIT = 20
+
+# Parameters of every strategy the autotuner (search_autotune.py) sweeps. hnsw_ef None is the default of the
+# collection. A tuned profile holds the chosen value of these per strategy, see load_profile().
+TUNABLE = {
+    "dense": ["hnsw_ef"],
+    "sparse": [],
+    "dense_bq": ["oversampling", "hnsw_ef"],
+    "rrf": ["prefetch_limit", "hnsw_ef"],
+    "bq_rrf": ["oversampling", "prefetch_limit", "hnsw_ef"]
+}
+
+def user_filter(user_id):
+    if user_id is None:
+        return None
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key='user_id',
+                match=models.MatchValue(value=user_id)
+            )
+        ]
+    )
+
+# Search parameters of one stage of a strategy. With exact=True every approximation is turned off:
+# no HNSW graph and no quantized vectors, which gives the ground truth of the strategy (see search_quality.py).
+def search_params(quantization=None, exact=False, hnsw_ef=None):
+    if exact:
+        return models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+    return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization) if quantization or hnsw_ef else None
+
+def build_request(strategy, query, limit=5, oversampling=OVERSAMPLING, prefetch_limit=PREFETCH_LIMIT, hnsw_ef=None, exact=False):
+    query_filter = user_filter(query["user_id"])
+    if strategy == "dense":
+        return models.QueryRequest(query=query["dense"], using="dense", params=search_params(exact=exact, hnsw_ef=hnsw_ef), filter=query_filter, limit=limit, with_payload=True)
+    if strategy == "sparse":
+        return models.QueryRequest(query=query["sparse"], using="sparse", params=search_params(exact=exact), filter=query_filter, limit=limit, with_payload=True)
+    if strategy == "dense_bq":
+        return models.QueryRequest(
+            query=query["dense"],
+            using="dense",
+            params=search_params(models.QuantizationSearchParams(ignore=False, rescore=True, oversampling=oversampling), exact, hnsw_ef),
+            filter=query_filter,
+            limit=limit,
+            with_payload=True
+        )
+    if strategy == "rrf":
+        return models.QueryRequest(
+            prefetch=[
+                models.Prefetch(query=query["dense"], using="dense", params=search_params(exact=exact, hnsw_ef=hnsw_ef), limit=prefetch_limit),
+                models.Prefetch(query=query["sparse"], using="sparse", params=search_params(exact=exact), limit=prefetch_limit)
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            # The filter is applied AFTER prefetching the results
+            filter=query_filter,
+            limit=limit,
+            with_payload=True
+        )
+    if strategy == "bq_rrf":
+        return models.QueryRequest(
+            prefetch=[
+                # Prefetch the dense vector from RAM using Binary Quantization while filtering the candidates using the user_id.
+                # No rescoring in the prefetch, it is done on the second stage with the dense vector from disk.
+                models.Prefetch(
+                    query=query["dense"],
+                    using="dense",
+                    limit=prefetch_limit,
+                    params=search_params(models.QuantizationSearchParams(ignore=False, rescore=False, oversampling=oversampling), exact, hnsw_ef),
+                    filter=query_filter
+                ),
+                # Prefetch the sparse vector from RAM
+                models.Prefetch(query=query["sparse"], using="sparse", params=search_params(exact=exact), limit=prefetch_limit)
+            ],
+            # In the second stage, the results are rescored using the dense vector from disk, then fused with RRF
+            params=search_params(models.QuantizationSearchParams(rescore=True), exact),
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=limit,
+            with_payload=True
+        )
+    raise ValueError(f"Unknown search strategy {strategy}, expected one of {', '.join(STRATEGIES)}")
+
+# Tuned parameters per strategy from a profile written by search_autotune.py, the file in SEARCH_PROFILE by default.
+# Without a profile every strategy runs with the defaults above.
+def load_profile(path=None):
+    path = path or os.getenv("SEARCH_PROFILE")
+    if not path:
+        return {}
+    with open(path) as f:
+        profile = json.load(f)
+    return {strategy: tuned["params"] for strategy, tuned in profile["strategies"].items()}
+
+# Runs a request built above through query_points, which names some of the fields differently
+def search(client, collection_name, request):
+    return client.query_points(
+        collection_name=collection_name,
+        query=request.query,
+        using=request.using,
+        prefetch=request.prefetch,
+        query_filter=request.filter,
+        search_params=request.params,
+        limit=request.limit,
+        with_payload=request.with_payload,
+        with_vectors=False
+    )
+
+# Runs several requests, of any strategy, in a single round trip
+def search_batch(client, collection_name, requests):
+    return client.query_batch_points(collection_name=collection_name, requests=requests)
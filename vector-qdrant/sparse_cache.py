@@ -0,0 +1,31 @@
+from sqlite_store import KeyValueStore
+import numpy as np
+import hashlib
+
+# Disk-backed cache of sparse embeddings, so re-ingesting the same texts skips the sparse model.
+# - The key is a SHA-256 of the model name and the text, a different model never returns a stale vector
+# - The value is the uint32 indices followed by the float32 values of the vector
+# - Lookups and inserts are done for a whole batch at once
+# The SQLite file (see sqlite_store.py) is opened by every embedding process, writers wait on each other for up to a minute.
+class SparseCache(KeyValueStore):
+    def __init__(self, path, model_name):
+        super().__init__(path, "sparse")
+        self.model_name = model_name
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).digest()
+
+    # Returns an (indices, values) pair for every text, or None when the text is not in the cache
+    def get_many(self, texts):
+        return [None if blob is None else decode(blob) for blob in super().get_many([self.key(text) for text in texts])]
+
+    # Store (indices, values) pairs for the texts in a single transaction
+    def put_many(self, texts, embeddings):
+        super().put_many([self.key(text) for text in texts], [encode(indices, values) for indices, values in embeddings])
+
+def encode(indices, values):
+    return np.asarray(indices, dtype="<u4").tobytes() + np.asarray(values, dtype="<f4").tobytes()
+
+def decode(blob):
+    size = len(blob) // 8
+    return np.frombuffer(blob, dtype="<u4", count=size), np.frombuffer(blob, dtype="<f4", offset=size * 4)
@@ -0,0 +1,53 @@
+import numpy as np
+import os
+
+# Pruning of SPLADE vectors. Splade_PP_en_v1 gives a passage a couple of hundred non-zero terms, most of them
+# with a small weight. Every term is a posting in the sparse inverted index and every query term a posting list
+# to walk, so dropping the weak terms shrinks the index and speeds up sparse queries. Three cutoffs, combinable:
+# - top_k: keep the k terms with the largest weights
+# - threshold: keep the terms with a weight of at least threshold
+# - mass: keep the largest terms that together make up this fraction of the total weight
+# The kept terms stay in their original (index) order.
+def prune(indices, values, top_k=None, threshold=None, mass=None):
+    indices, values = np.asarray(indices), np.asarray(values)
+    order = np.argsort(-values, kind="stable")
+    keep = len(order)
+    if top_k is not None:
+        keep = min(keep, top_k)
+    if threshold is not None:
+        keep = min(keep, int(np.count_nonzero(values >= threshold)))
+    if mass is not None and len(values):
+        cumulative = np.cumsum(values[order])
+        keep = min(keep, int(np.searchsorted(cumulative, mass * cumulative[-1])) + 1)
+    kept = np.sort(order[:keep])
+    return indices[kept], values[kept]
+
+# Prune every row of a batch of sparse vectors in CSR form (indptr, indices, values), see batch_upload.py
+def prune_csr(indptr, indices, values, **pruning):
+    rows = [prune(indices[start:end], values[start:end], **pruning) for start, end in zip(indptr[:-1], indptr[1:])]
+    pruned_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row_indices) for row_indices, _ in rows], out=pruned_indptr[1:])
+    return (
+        pruned_indptr,
+        np.concatenate([row_indices for row_indices, _ in rows] or [np.empty(0, dtype=indices.dtype)]),
+        np.concatenate([row_values for _, row_values in rows] or [np.empty(0, dtype=values.dtype)])
+    )
+
+# Pruning settings from the environment, <prefix>TOP_K, <prefix>THRESHOLD and <prefix>MASS.
+# SPARSE_ applies to the ingested vectors and SPARSE_QUERY_ to query vectors. Returns None without any of them.
+def pruning_from_env(prefix="SPARSE_"):
+    pruning = {
+        "top_k": os.getenv(f"{prefix}TOP_K"),
+        "threshold": os.getenv(f"{prefix}THRESHOLD"),
+        "mass": os.getenv(f"{prefix}MASS")
+    }
+    return parse_pruning(pruning)
+
+# Turns {"top_k": "64", "mass": "0.9", ...} (strings, None for unset) into pruning settings, None when all are unset
+def parse_pruning(pruning):
+    types = {"top_k": int, "threshold": float, "mass": float}
+    parsed = {key: types[key](value) for key, value in pruning.items() if value not in (None, "")}
+    return parsed or None
+
+def describe(pruning):
+    return ", ".join(f"{key}={value}" for key, value in pruning.items()) if pruning else "none"
@@ -0,0 +1,45 @@
+import sqlite3
+import threading
+import os
+
+# Key/value table in a SQLite file, the storage of the sparse cache, the text store and the query embedding cache.
+# - WAL mode lets every process open the same file, writers wait on each other for up to a minute
+# - The connection is shared by the threads of a process behind a lock
+# - Lookups and inserts are done for a whole batch at once
+class KeyValueStore:
+    # SQLite limits the number of parameters of a single statement
+    CHUNK_SIZE = 900
+
+    def __init__(self, path, table, key_column="key", value_column="vector", key_type="BLOB", value_type="BLOB"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.table = table
+        self.key_column = key_column
+        self.value_column = value_column
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({key_column} {key_type} PRIMARY KEY, {value_column} {value_type}) WITHOUT ROWID")
+
+    # The value of every key, None for keys that are not in the store
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), self.CHUNK_SIZE):
+                chunk = keys[start:start + self.CHUNK_SIZE]
+                found.update(self.connection.execute(
+                    f"SELECT {self.key_column}, {self.value_column} FROM {self.table} WHERE {self.key_column} IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ))
+        return [found.get(key) for key in keys]
+
+    # Store the values in a single transaction
+    def put_many(self, keys, values):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} ({self.key_column}, {self.value_column}) VALUES (?, ?)",
+                zip(keys, values)
+            )
+
+    def close(self):
+        self.connection.close()
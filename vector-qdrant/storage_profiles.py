@@ -0,0 +1,52 @@
+from qdrant_client import models
+from dbpedia_cache import DENSE_SIZE
+import numpy as np
+
+# Storage profiles of the dense vector. Rescoring reads the original vectors from disk, at 1M points that is
+# 6 GB for float32, a smaller datatype cuts that I/O at the cost of some precision:
+# - float32: 4 bytes per dimension, cosine, binary quantization in RAM for the candidates
+# - float16: 2 bytes per dimension, Qdrant converts the uploaded floats itself, the rest is the same as float32
+# - uint8: 1 byte per dimension. Qdrant casts uploaded and query values to uint8 as they are, so the vectors
+#   (and the queries) are mapped onto 0..255 by the client: round(128 + x * scale), clipped. The offset of 128
+#   distorts cosine and dot product, but cancels out in the euclidean distance, which ranks normalized vectors
+#   (like the OpenAI embeddings) in the same order as cosine does. With the offset every value is positive,
+#   so binary quantization (the sign bits) carries no information and the uint8 vectors are searched directly.
+# The profile of a collection is stored in its metadata, so queries can be encoded the same way.
+PROFILES = {
+    "float32": {"datatype": models.Datatype.FLOAT32, "distance": models.Distance.COSINE, "binary_quantization": True},
+    "float16": {"datatype": models.Datatype.FLOAT16, "distance": models.Distance.COSINE, "binary_quantization": True},
+    "uint8": {"datatype": models.Datatype.UINT8, "distance": models.Distance.EUCLID, "binary_quantization": False},
+}
+
+# The components of the normalized 1536-d OpenAI embeddings stay well within +-0.25, larger values get clipped
+UINT8_SCALE = 127 / 0.25
+
+def dense_vector_params(profile):
+    return models.VectorParams(
+        size=DENSE_SIZE,
+        distance=PROFILES[profile]["distance"],
+        datatype=PROFILES[profile]["datatype"],
+        on_disk=True # We store the dense vector on disk
+    )
+
+def quantization_config(profile):
+    if not PROFILES[profile]["binary_quantization"]:
+        return None
+    return models.BinaryQuantization(
+        binary=models.BinaryQuantizationConfig(always_ram=True), # We store the BQ vector in RAM
+    )
+
+# Dense vectors as they are uploaded: a float32 matrix, holding whole numbers for uint8
+def encode_dense(profile, dense):
+    dense = np.asarray(dense, dtype=np.float32)
+    if profile != "uint8":
+        return dense
+    return np.clip(np.rint(128 + dense * UINT8_SCALE), 0, 255).astype(np.float32)
+
+def encode_query(profile, vector):
+    return encode_dense(profile, vector).tolist()
+
+# Collections created before the profiles existed have no metadata and are float32
+def collection_profile(client, collection_name):
+    metadata = client.get_collection(collection_name).config.metadata or {}
+    return metadata.get("storage_profile", "float32")